@@ -1,6 +1,7 @@
 """Python language sever implementation"""
 
 import argparse
+import asyncio
 import json
 import logging
 import sys
@@ -8,11 +9,19 @@ from dataclasses import dataclass
 from functools import partial
 from importlib import import_module
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
+from pyserver.async_server import AsyncLSPServer
+from pyserver.backend import ProcessBackend
 from pyserver.handler import LSPHandler
-from pyserver.server import LSPServer
-from pyserver.transport import StandardIO
+from pyserver.server import (
+    LSPServer,
+    Priority,
+    DEFAULT_DIAGNOSTICS_DELAY,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+)
+from pyserver.transport import AsyncStandardIO, StandardIO
 
 printerr = partial(print, file=sys.stderr)
 """print to stderr"""
@@ -25,6 +34,10 @@ if ver < (3, 8):
 
 __version__ = "0.1.0"
 
+# megabytes
+DEFAULT_COMPLETION_CACHE_SIZE = 32
+DEFAULT_COMPLETION_LIMIT = 100
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -38,6 +51,65 @@ def main():
         help="communicate through standard input",
     )
 
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="run server on asyncio event loop",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"number of request worker threads (default: {DEFAULT_WORKERS})",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"maximum number of waiting requests (default: {DEFAULT_QUEUE_SIZE})",
+    )
+
+    parser.add_argument(
+        "--diagnostics-delay",
+        type=int,
+        default=int(DEFAULT_DIAGNOSTICS_DELAY * 1000),
+        metavar="MILLISECONDS",
+        help="wait document unchanged before publish diagnostics",
+    )
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help=(
+            "run features in a pool of analysis processes, worker threads use "
+            "jedi one at a time (default: disabled)"
+        ),
+    )
+
+    parser.add_argument(
+        "--completion-cache-size",
+        type=int,
+        default=DEFAULT_COMPLETION_CACHE_SIZE,
+        metavar="MEGABYTES",
+        help=(
+            "memory budget of cached completion items "
+            f"(default: {DEFAULT_COMPLETION_CACHE_SIZE})"
+        ),
+    )
+
+    parser.add_argument(
+        "--completion-limit",
+        type=int,
+        default=DEFAULT_COMPLETION_LIMIT,
+        help=(
+            "maximum number of completion items sent to client "
+            f"(default: {DEFAULT_COMPLETION_LIMIT})"
+        ),
+    )
+
     parser.add_argument("-v", "--version", action="store_true", help="print version")
     parser.add_argument("--verbose", action="store_true", help="verbose logging")
 
@@ -47,7 +119,9 @@ def main():
         printerr("version", __version__)
         sys.exit(0)
 
-    if arguments.stdin:
+    if arguments.stdin and arguments.asyncio:
+        transport_ = AsyncStandardIO()
+    elif arguments.stdin:
         transport_ = StandardIO()
     else:
         printerr("Currently only standard input implementation available.")
@@ -59,11 +133,39 @@ def main():
         log_level = logging.DEBUG
     setup_logger(log_level)
 
+    # features configured alike in server and analysis processes
+    configure = partial(
+        configure_features,
+        arguments.completion_cache_size * 1024 * 1024,
+        arguments.completion_limit,
+    )
+    configure()
+
+    backend = None
+    if arguments.processes > 0:
+        backend = ProcessBackend(arguments.processes, get_process_modules(), configure)
+
     handler_ = LSPHandler()
-    load_features(handler_)
+    features = load_features(handler_, backend)
+
+    server_class = AsyncLSPServer if arguments.asyncio else LSPServer
+    srv = server_class(
+        transport_,
+        handler_.handle,
+        workers=arguments.workers,
+        priorities=get_priorities(features),
+        deadlines=get_deadlines(features),
+        queue_size=arguments.queue_size,
+        diagnostics_delay=arguments.diagnostics_delay / 1000,
+    )
+
+    if arguments.asyncio:
+        asyncio.run(srv.listen())
+    else:
+        srv.listen()
 
-    srv = LSPServer(transport_, handler_.handle)
-    srv.listen()
+    if backend:
+        backend.shutdown()
 
 
 def setup_logger(level: int):
@@ -98,22 +200,77 @@ def try_import(mod_name: str, /, attr_name: str = "") -> Optional[Any]:
         return None
 
 
+def configure_features(completion_cache_budget: int, completion_limit: int) -> None:
+    """apply command line options to feature modules"""
+
+    if configure := try_import("pyserver.features.completion", "configure"):
+        configure(completion_cache_budget, completion_limit)
+
+
 @dataclass
 class FeatureConfig:
     method: str
     module: str
     handler: str
+    priority: str = "normal"
+    # feature may run in analysis process
+    process: bool = False
+    # feature run in every analysis process, e.g. to warm up caches
+    broadcast: bool = False
+    # every open document sent to analysis process, e.g. rename edit them
+    open_documents: bool = False
+    # feature handle notification, analysis processes not waited
+    notification: bool = False
+    # milliseconds before feature return partial result
+    deadline: Optional[int] = None
 
 
-def load_features(handler: LSPHandler):
-    """load features"""
-
+def read_feature_configs() -> List[FeatureConfig]:
     config_path = Path(__file__).parent / "config.json"
-    configs = [FeatureConfig(**c) for c in json.loads(config_path.read_text())]
+    return [FeatureConfig(**c) for c in json.loads(config_path.read_text())]
+
+
+def get_process_modules() -> List[str]:
+    """get feature modules loaded in analysis process"""
+    return [c.module for c in read_feature_configs() if c.process]
 
+
+def load_features(
+    handler: LSPHandler, backend: Optional[ProcessBackend] = None
+) -> List[FeatureConfig]:
+    """load features, return loaded feature configs"""
+
+    configs = read_feature_configs()
+
+    loaded = []
     for c in configs:
         if func := try_import(c.module, c.handler):
+            if backend and c.process:
+                func = backend.wrap(
+                    c.module, c.handler, c.broadcast, c.open_documents, c.notification
+                )
             handler.register_handlers({c.method: func})
+            loaded.append(c)
         else:
             err_message = f"Error load feature {c.method!r}."
             printerr(err_message)
+
+    return loaded
+
+
+def get_priorities(configs: List[FeatureConfig]) -> Dict[str, Priority]:
+    """get request priority for each feature method"""
+
+    priorities = {}
+    for c in configs:
+        try:
+            priorities[c.method] = Priority.from_string(c.priority)
+        except ValueError as err:
+            printerr(f"Error load feature {c.method!r} priority: {err}")
+
+    return priorities
+
+
+def get_deadlines(configs: List[FeatureConfig]) -> Dict[str, float]:
+    """get request deadline seconds for each feature method"""
+    return {c.method: c.deadline / 1000 for c in configs if c.deadline is not None}
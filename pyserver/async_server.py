@@ -0,0 +1,613 @@
+"""LSP implementation on asyncio event loop"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from functools import partial
+from typing import Deque, Dict, List, Optional, Set, Tuple, Type, Union
+
+from pyserver import errors
+from pyserver.cancellation import CancellationToken, use_token
+from pyserver.message import (
+    Message,
+    Notification,
+    Request,
+    Response,
+    dumps,
+    loads,
+)
+from pyserver.server import (
+    DEFAULT_DIAGNOSTICS_DELAY,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+    DocumentVersions,
+    Error,
+    HandleFunction,
+    Id,
+    MethodName,
+    Params,
+    Priority,
+    QueuedRequest,
+    REQUEST_STATS,
+    RequestManager,
+    RequestStats,
+    Result,
+    ServerRequestManager,
+    ServerTerminated,
+    get_changed_line,
+    get_document_uri,
+    get_warm_up_request,
+    merge_document_changes,
+)
+from pyserver.transport import AsyncTransport
+
+LOGGER = logging.getLogger("pyserver")
+
+
+class RequestSlots:
+    """Limit number of concurrently handled requests
+
+    Waiting requests are admitted by priority, waiting request priority is
+    aged like in 'RequestManager'. Idle priority is not aged.
+    """
+
+    def __init__(self, size: int, aging_interval: float):
+        self.available = size
+        self.aging_interval = aging_interval
+        self.waiters: List[tuple] = []
+
+    async def acquire(self, priority: Priority) -> None:
+        if self.available and not self.waiters:
+            self.available -= 1
+            return
+
+        loop = asyncio.get_running_loop()
+        waiter = (priority, time.monotonic(), loop.create_future())
+        self.waiters.append(waiter)
+        try:
+            await waiter[2]
+        except asyncio.CancelledError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            elif not waiter[2].cancelled():
+                # slot passed to canceled waiter
+                self.release()
+            raise
+
+    def release(self) -> None:
+        if not self.waiters:
+            self.available += 1
+            return
+
+        def effective_priority(waiter: tuple) -> float:
+            if waiter[0] is Priority.Idle:
+                return float(waiter[0])
+            return waiter[0] - (now - waiter[1]) / self.aging_interval
+
+        now = time.monotonic()
+        waiter = min(self.waiters, key=effective_priority)
+        self.waiters.remove(waiter)
+        waiter[2].set_result(None)
+
+    @asynccontextmanager
+    async def hold(self, priority: Priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class DocumentOrder:
+    """Keep request order on a document
+
+    Requests on readonly method wait previous exclusive request, exclusive
+    request wait all previous requests.
+    """
+
+    def __init__(self):
+        self.last_exclusive: Optional[asyncio.Task] = None
+        self.readers: Set[asyncio.Task] = set()
+
+    def get_blocking_tasks(self, is_exclusive: bool) -> Set[asyncio.Task]:
+        current = asyncio.current_task()
+        self.readers = {t for t in self.readers if not t.done()}
+        blocking = set()
+        if self.last_exclusive:
+            blocking.add(self.last_exclusive)
+
+        if is_exclusive:
+            blocking.update(self.readers)
+            self.last_exclusive = current
+            self.readers = set()
+        else:
+            self.readers.add(current)
+
+        return {t for t in blocking if not t.done()}
+
+
+class AsyncLSPServer:
+    """LSP server on asyncio event loop
+
+    Requests handled as asyncio task, the handle function is called in
+    executor thread. Canceling the task cancel the request token. Like in
+    'RequestManager', executor threads use jedi one at a time.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncTransport,
+        handle_func: HandleFunction,
+        /,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        priorities: Optional[Dict[MethodName, Priority]] = None,
+        deadlines: Optional[Dict[MethodName, float]] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        diagnostics_delay: float = DEFAULT_DIAGNOSTICS_DELAY,
+    ):
+        self.transport = transport
+        self.handle_func = handle_func
+        self.workers = max(workers, 1)
+        self.priorities = priorities or {}
+        # seconds to handle request before its token expired
+        self.deadlines = deadlines or {}
+        self.queue_size = max(queue_size, 1)
+        self.diagnostics_delay = diagnostics_delay
+
+        self.executor = ThreadPoolExecutor(
+            self.workers, thread_name_prefix="request-worker"
+        )
+        self.request_slots = RequestSlots(self.workers, RequestManager.aging_interval)
+        self.request_tasks: Dict[Id, asyncio.Task] = {}
+        self.request_items: Dict[Id, QueuedRequest] = {}
+        # requests not started yet
+        self.waiting_requests: Set[Id] = set()
+        # error class to answer canceled request
+        self.canceled_errors: Dict[Id, Type[errors.JSONRPCException]] = {}
+        self.request_stats = RequestStats()
+        # opened document version, requests tagged with target document version
+        self.document_versions = DocumentVersions()
+        self.document_orders: Dict[str, DocumentOrder] = {}
+        self.server_request_manager = ServerRequestManager()
+
+        # diagnostics task for each document
+        self.diagnostics_tasks: Dict[str, asyncio.Task] = {}
+        # internal idle task for each method and document
+        self.idle_tasks: Dict[Tuple[MethodName, Optional[str]], asyncio.Task] = {}
+        # idle tasks holding a request slot
+        self.running_idle_tasks: Set[asyncio.Task] = set()
+        # idle tasks canceled by client request, started again when stopped
+        self.preempted_idle_tasks: Set[asyncio.Task] = set()
+        # set while no client request waiting or running
+        self.requests_done = asyncio.Event()
+        self.requests_done.set()
+
+        # messages read by reader task, reading error put as last item
+        self.received_messages: "asyncio.Queue[Union[Message, Exception]]" = (
+            asyncio.Queue()
+        )
+        # messages taken from queue but not executed yet
+        self._unread_messages: Deque[Union[Message, Exception]] = deque()
+
+    async def send_message(self, message: Message):
+        LOGGER.debug("Send >> %s", message)
+        content = dumps(message, as_bytes=True)
+        await self.transport.write(content)
+
+    async def send_request(
+        self, method: MethodName, params: Params, timeout: Optional[float] = None
+    ) -> Result:
+        """send request to client, return response result"""
+        request_id, future = self.server_request_manager.add(method, timeout)
+        await self.send_message(Request(request_id, method, params))
+        return await asyncio.wrap_future(future)
+
+    async def send_response(
+        self, request_id: Id, result: Result = None, error: Error = None
+    ):
+        await self.send_message(Response(request_id, result, error))
+
+    async def send_notification(self, method: MethodName, params: Params):
+        await self.send_message(Notification(method, params))
+
+    async def listen(self):
+        """listen client message"""
+
+        await self.transport.listen_connection()
+        LOGGER.debug("Start asyncio server with %d workers.", self.workers)
+
+        reader = asyncio.create_task(self._read_messages())
+        try:
+            await self._listen_message()
+
+        except ServerTerminated:
+            pass
+        except Exception as err:
+            await self.send_notification(
+                "window/logMessage", {"type": 1, "message": repr(err)}
+            )
+        finally:
+            reader.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _read_messages(self):
+        """read messages from transport until error or end of input"""
+
+        while True:
+            try:
+                content = await self.transport.read()
+                try:
+                    message = loads(content)
+                except ValueError as err:
+                    raise errors.ParseError(err) from err
+
+            except Exception as err:
+                self.received_messages.put_nowait(err)
+                return
+
+            LOGGER.debug("Received << %s", message)
+            self.received_messages.put_nowait(message)
+
+    async def _get_message(self) -> Message:
+        if self._unread_messages:
+            item = self._unread_messages.popleft()
+        else:
+            item = await self.received_messages.get()
+
+        if isinstance(item, Exception):
+            # reader stopped, raise the error on every call
+            self._unread_messages.appendleft(item)
+            raise item
+        return item
+
+    def _coalesce_changes(self, message: Notification) -> Notification:
+        """merge following document changes already received"""
+
+        merged_count = 1
+        while not self._unread_messages:
+            try:
+                other = self.received_messages.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+            if not (merged := merge_document_changes(message, other)):
+                # error raised at next message
+                self._unread_messages.appendleft(other)
+                break
+
+            message = merged
+            merged_count += 1
+
+        if merged_count > 1:
+            LOGGER.debug("Merged %d document changes.", merged_count)
+        return message
+
+    async def _listen_message(self):
+        """listen message"""
+
+        while True:
+            try:
+                message = await self._get_message()
+            except EOFError:
+                return
+
+            if (
+                isinstance(message, Notification)
+                and message.method == "textDocument/didChange"
+            ):
+                message = self._coalesce_changes(message)
+            await self.exec_message(message)
+
+    async def run_in_executor(
+        self, token: CancellationToken, method: MethodName, params: Params
+    ) -> Result:
+        """run handle function in executor thread"""
+
+        def handle():
+            with use_token(token):
+                return self.handle_func(method, params)
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, handle)
+        except asyncio.CancelledError:
+            # stop the executor thread at next token check
+            token.cancel()
+            raise
+
+    async def exec_notification(self, message: Notification):
+        method = message.method
+        params = message.params
+
+        if method == "exit":
+            await self.transport.terminate()
+            raise ServerTerminated()
+
+        if method == "$/cancelRequest":
+            self.cancel_request(params["id"], errors.RequestCancelled)
+            return
+
+        self.handle_func(method, params)
+
+        if method in {
+            "textDocument/didOpen",
+            "textDocument/didChange",
+            "textDocument/didClose",
+        }:
+            if self.document_versions.update(method, params):
+                # result of request on previous version is invalid
+                uri = get_document_uri(params)
+                self.cancel_outdated(
+                    uri, self.document_versions.get(uri), get_changed_line(params)
+                )
+
+        if method in {
+            "textDocument/didOpen",
+            "textDocument/didChange",
+        }:
+            # publish diagnostics
+            self.publish_diagnostics(params)
+
+        if warm_up := get_warm_up_request(method, params):
+            self.exec_idle(*warm_up)
+
+    def cancel_request(
+        self, request_id: Id, error_class: Type[errors.JSONRPCException]
+    ) -> None:
+        if task := self.request_tasks.get(request_id):
+            # first cancelation reason reported
+            self.canceled_errors.setdefault(request_id, error_class)
+            task.cancel()
+
+    def cancel_outdated(self, uri: str, version: int, changed_line: int = 0):
+        """cancel requests which result invalid in new version of document"""
+        for request_id, item in self.request_items.items():
+            if item.is_outdated(uri, version, changed_line):
+                self.cancel_request(request_id, errors.ContentModified)
+
+    def publish_diagnostics(self, params: dict):
+        uri = get_document_uri(params)
+        # only latest document changes checked
+        if task := self.diagnostics_tasks.get(uri):
+            task.cancel()
+
+        self.diagnostics_tasks[uri] = asyncio.create_task(
+            self._publish_diagnostics(uri, params)
+        )
+
+    async def _publish_diagnostics(self, uri: str, params: dict):
+        token = CancellationToken()
+        try:
+            # wait until document unchanged, newer changes cancel this task
+            await asyncio.sleep(self.diagnostics_delay)
+            async with self.request_slots.hold(Priority.Background):
+                diagnostics_params = await self.run_in_executor(
+                    token, "textDocument/publishDiagnostics", params
+                )
+
+        except (
+            asyncio.CancelledError,
+            errors.RequestCancelled,
+            errors.InvalidParams,
+            errors.ContentModified,
+            errors.InvalidResource,
+            errors.MethodNotFound,
+        ):
+            # ignore above exception
+            pass
+
+        except Exception as err:
+            LOGGER.debug("Error get diagnostics: '%s'", err, exc_info=True)
+
+        else:
+            await self.send_notification(
+                "textDocument/publishDiagnostics", diagnostics_params
+            )
+
+        finally:
+            if self.diagnostics_tasks.get(uri) is asyncio.current_task():
+                del self.diagnostics_tasks[uri]
+
+    def exec_idle(self, method: MethodName, params: Params):
+        """run internal request while no client request waiting or running"""
+
+        key = (method, get_document_uri(params))
+        # previous idle task on the same method and document is outdated
+        if task := self.idle_tasks.get(key):
+            task.cancel()
+
+        self.idle_tasks[key] = asyncio.create_task(
+            self._handle_idle(key, method, params)
+        )
+
+    async def _handle_idle(self, key: tuple, method: MethodName, params: Params):
+        token = CancellationToken()
+        task = asyncio.current_task()
+        try:
+            await self.requests_done.wait()
+            async with self.request_slots.hold(Priority.Idle):
+                if not self.requests_done.is_set():
+                    # client request received while waiting request slot
+                    self.preempted_idle_tasks.add(task)
+                    return
+                self.running_idle_tasks.add(task)
+                await self.run_in_executor(token, method, params)
+
+        except (
+            asyncio.CancelledError,
+            errors.RequestCancelled,
+            errors.ServerCancelled,
+        ):
+            LOGGER.debug("Internal request %r canceled.", method)
+
+        except Exception as err:
+            LOGGER.debug(
+                "Error handle internal request %r: '%s'", method, err, exc_info=True
+            )
+
+        finally:
+            self.running_idle_tasks.discard(task)
+            if self.idle_tasks.get(key) is task:
+                del self.idle_tasks[key]
+                if task in self.preempted_idle_tasks:
+                    self.exec_idle(method, params)
+            self.preempted_idle_tasks.discard(task)
+
+    def _preempt_idle_tasks(self):
+        """cancel running idle tasks when client request received"""
+        # idle task may hold resources needed by client request, e.g. jedi
+        for task in self.running_idle_tasks:
+            task.cancel()
+            self.preempted_idle_tasks.add(task)
+
+    async def exec_request(self, message: Request):
+        if message.method == REQUEST_STATS:
+            # answered at once, queue may be full
+            await self.send_response(message.id, self.get_stats())
+            return
+
+        uri = get_document_uri(message.params)
+        priority = self.priorities.get(message.method, Priority.Normal)
+        item = QueuedRequest(message, priority, self.document_versions.get(uri))
+        self.request_stats.received += 1
+
+        # waiting request on the same method and document is outdated
+        for request_id in list(self.waiting_requests):
+            if self.request_items[request_id].is_superseded_by(item):
+                self.cancel_request(request_id, errors.ServerCancelled)
+                self.request_stats.superseded += 1
+
+        self.request_items[message.id] = item
+        self.waiting_requests.add(message.id)
+        self.requests_done.clear()
+        self._preempt_idle_tasks()
+        task = asyncio.create_task(self.handle_request(message))
+        task.add_done_callback(partial(self._on_request_done, message))
+        self.request_tasks[message.id] = task
+
+        self._shed_waiting_requests()
+
+    def _shed_waiting_requests(self):
+        """shed lowest priority request if too many requests waiting"""
+
+        waiting = [
+            self.request_items[request_id]
+            for request_id in self.waiting_requests
+            if request_id not in self.canceled_errors
+        ]
+        self.request_stats.max_queue_depth = max(
+            self.request_stats.max_queue_depth, len(waiting)
+        )
+        if len(waiting) <= self.queue_size:
+            return
+
+        now = time.monotonic()
+        # newest request picked if priority equal
+        lowest = max(
+            sorted(waiting, key=lambda q: q.queued_time, reverse=True),
+            key=lambda q: q.effective_priority(now, RequestManager.aging_interval),
+        )
+        self.cancel_request(lowest.request.id, errors.ServerCancelled)
+        self.request_stats.shed += 1
+        LOGGER.debug(
+            "Request queue full (%d), %d superseded, %d shed.",
+            self.queue_size,
+            self.request_stats.superseded,
+            self.request_stats.shed,
+        )
+
+    def get_stats(self) -> dict:
+        """get request queue statistics"""
+        return {
+            **asdict(self.request_stats),
+            "queue_depth": len(self.waiting_requests),
+            "running": len(self.request_tasks) - len(self.waiting_requests),
+        }
+
+    def _release_request(self, message: Request) -> Type[errors.JSONRPCException]:
+        """release request, return error class if request canceled"""
+
+        del self.request_tasks[message.id]
+        del self.request_items[message.id]
+        self.waiting_requests.discard(message.id)
+        self.request_stats.handled += 1
+        if not self.request_tasks:
+            self.requests_done.set()
+
+        return self.canceled_errors.pop(message.id, errors.RequestCancelled)
+
+    def _on_request_done(self, message: Request, task: asyncio.Task):
+        if not task.cancelled():
+            return
+
+        # task canceled before started
+        error = self._release_request(message)(f'request canceled "{message.id}"')
+        asyncio.create_task(
+            self.send_response(message.id, None, errors.transform_error(error))
+        )
+
+    async def _wait_document_order(self, message: Request):
+        if not (uri := get_document_uri(message.params)):
+            return
+
+        order = self.document_orders.setdefault(uri, DocumentOrder())
+        is_exclusive = message.method not in RequestManager.readonly_methods
+        if blocking := order.get_blocking_tasks(is_exclusive):
+            await asyncio.wait(blocking)
+
+    async def handle_request(self, message: Request):
+        result, error = None, None
+        priority = self.request_items[message.id].priority
+
+        try:
+            await self._wait_document_order(message)
+            async with self.request_slots.hold(priority):
+                self.waiting_requests.remove(message.id)
+                token = CancellationToken(self.deadlines.get(message.method))
+                result = await self.run_in_executor(
+                    token, message.method, message.params
+                )
+
+        except asyncio.CancelledError:
+            error = errors.RequestCancelled(f'request canceled "{message.id}"')
+
+        except (
+            errors.RequestCancelled,
+            errors.ServerCancelled,
+            errors.InvalidParams,
+            errors.ContentModified,
+            errors.InvalidResource,
+            errors.MethodNotFound,
+        ) as err:
+            error = err
+
+        except Exception as err:
+            LOGGER.debug("Error handle request: '%s'", err, exc_info=True)
+            error = errors.InternalError(err)
+
+        # request can't be canceled after released
+        error_class = self._release_request(message)
+        if isinstance(error, errors.RequestCancelled):
+            error = error_class(f'request canceled "{message.id}"')
+
+        if error:
+            # set result to None if error occured
+            result = None
+
+        await self.send_response(message.id, result, errors.transform_error(error))
+
+    async def exec_response(self, message: Response):
+        self.server_request_manager.resolve(message)
+
+    async def exec_message(self, message: Message) -> None:
+        exec_map = {
+            Notification: self.exec_notification,
+            Request: self.exec_request,
+            Response: self.exec_response,
+        }
+        return await exec_map[type(message)](message)
@@ -0,0 +1,292 @@
+"""process pool analysis backend"""
+
+import itertools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from dataclasses import dataclass
+from importlib import import_module
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token, use_token
+from pyserver.document import Document
+from pyserver.handler import Params, SessionHandleFunction
+from pyserver.session import Session, SessionStatus
+from pyserver.uri import uri_to_path
+
+LOGGER = logging.getLogger("pyserver")
+
+
+@dataclass
+class DocumentSnapshot:
+    """Document data sent to worker process"""
+
+    workspace_path: Path
+    file_path: Path
+    language_id: str
+    version: int
+    text: str
+    position_encoding: str
+    client_capabilities: dict
+
+
+# Worker process session, live as long as the worker process.
+# Features keep their module level caches (jedi caches) warm in each worker.
+_worker_session: Optional[Session] = None
+# id of request canceled by main process, shared with main process
+_canceled_request: Optional[Any] = None
+
+
+class _WorkerToken(CancellationToken):
+    """token of request in worker process, canceled by main process"""
+
+    def __init__(self, timeout: Optional[float], request_id: int):
+        super().__init__(timeout)
+        self.request_id = request_id
+
+    def is_canceled(self) -> bool:
+        return _canceled_request.value == self.request_id or super().is_canceled()
+
+    def check(self) -> None:
+        if _canceled_request.value == self.request_id:
+            raise errors.RequestCancelled("operation canceled")
+        super().check()
+
+
+def _initialize_worker(
+    modules: Iterable[str],
+    canceled_request: Any,
+    configure: Optional[Callable[[], None]],
+) -> None:
+    global _worker_session, _canceled_request
+    _worker_session = Session()
+    _worker_session.status = SessionStatus.Initialized
+    _canceled_request = canceled_request
+
+    # import features before the first request
+    for module in modules:
+        try:
+            import_module(module)
+        except Exception as err:
+            LOGGER.debug("Error import %r in worker: '%s'", module, err)
+
+    if configure:
+        configure()
+
+
+def _run_handler(
+    module: str,
+    handler: str,
+    snapshots: Iterable[DocumentSnapshot],
+    params: Params,
+    timeout: Optional[float],
+    request_id: int,
+) -> Any:
+    """run feature handler inside worker process"""
+
+    session = _worker_session
+    # worker session only hold documents sent with current request
+    session.working_documents.clear()
+    for snapshot in snapshots:
+        session.root_path = snapshot.workspace_path
+        session.position_encoding = snapshot.position_encoding
+        session.client_capabilities = snapshot.client_capabilities
+        session.add_document(
+            snapshot.file_path,
+            snapshot.language_id,
+            snapshot.version,
+            snapshot.text,
+        )
+
+    func = getattr(import_module(module), handler)
+    # request deadline applied in worker process
+    with use_token(_WorkerToken(timeout, request_id)):
+        return func(session, params)
+
+
+class _Worker:
+    """worker process, run one request at a time"""
+
+    def __init__(
+        self,
+        context: Any,
+        modules: Iterable[str],
+        configure: Optional[Callable[[], None]],
+    ):
+        self.canceled_request = context.Value("q", -1, lock=False)
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=context,
+            initializer=_initialize_worker,
+            initargs=(tuple(modules), self.canceled_request, configure),
+        )
+        # submitted requests not finished yet
+        self.pending = 0
+
+
+class ProcessBackend:
+    """Run feature handlers in a pool of worker processes
+
+    Feature handler must only access the document targeted by request
+    from session, or every open document if wrapped with 'open_documents'.
+    Results must be picklable. 'configure' called in each worker after
+    feature modules imported, it must be picklable too.
+    """
+
+    # interval to check request cancelation while waiting result
+    poll_interval = 0.05
+
+    def __init__(
+        self,
+        processes: int,
+        modules: Iterable[str] = (),
+        configure: Optional[Callable[[], None]] = None,
+    ):
+        # worker process started with 'spawn' to avoid forking threads
+        context = multiprocessing.get_context("spawn")
+        # request may be sent to every worker, each worker has its executor
+        self.workers = [_Worker(context, modules, configure) for _ in range(processes)]
+        self.processes = processes
+        self._request_ids = itertools.count()
+        self._lock = threading.Lock()
+        LOGGER.debug("Start analysis backend with %d processes.", processes)
+
+    def shutdown(self) -> None:
+        for worker in self.workers:
+            worker.executor.shutdown(wait=False, cancel_futures=True)
+
+    def wrap(
+        self,
+        module: str,
+        handler: str,
+        broadcast: bool = False,
+        open_documents: bool = False,
+        notification: bool = False,
+    ) -> SessionHandleFunction:
+        """wrap feature handler to run in worker process
+
+        Handler run in every worker if 'broadcast', result of the first
+        worker returned. Every open document sent to worker if
+        'open_documents', e.g. rename edit other documents.
+
+        Notification handler is not waited, worker handle it before
+        requests submitted later.
+        """
+
+        def handle(session: Session, params: Params) -> Any:
+            if open_documents:
+                snapshots = tuple(
+                    self._to_snapshot(session, document)
+                    for document in list(session.working_documents.values())
+                )
+            else:
+                snapshots = self._get_snapshots(session, params)
+            token = get_token()
+            workers = self.workers if broadcast else [self._select_worker()]
+            requests = [
+                self._submit(worker, module, handler, snapshots, params, token)
+                for worker in workers
+            ]
+            if notification:
+                return None
+
+            try:
+                results = [self._wait_result(*request, token) for request in requests]
+            finally:
+                # other workers stopped if one of them failed
+                for request in requests:
+                    self._cancel(*request)
+            return results[0]
+
+        return handle
+
+    def _select_worker(self) -> _Worker:
+        with self._lock:
+            return min(self.workers, key=lambda worker: worker.pending)
+
+    def _submit(
+        self,
+        worker: _Worker,
+        module: str,
+        handler: str,
+        snapshots: Iterable[DocumentSnapshot],
+        params: Params,
+        token: CancellationToken,
+    ) -> tuple:
+        request_id = next(self._request_ids)
+        with self._lock:
+            worker.pending += 1
+        future = worker.executor.submit(
+            _run_handler,
+            module,
+            handler,
+            snapshots,
+            params,
+            token.remaining(),
+            request_id,
+        )
+        future.add_done_callback(lambda _: self._release(worker))
+        return worker, request_id, future
+
+    def _release(self, worker: _Worker) -> None:
+        with self._lock:
+            worker.pending -= 1
+
+    @staticmethod
+    def _cancel(worker: _Worker, request_id: int, future: Future) -> None:
+        if future.cancel() or future.done():
+            return
+        # running handler stopped at its next token check
+        worker.canceled_request.value = request_id
+
+    @classmethod
+    def _get_snapshots(
+        cls, session: Session, params: Params
+    ) -> Tuple[DocumentSnapshot, ...]:
+        """get snapshot of document targeted by params"""
+        try:
+            uri = params["textDocument"]["uri"]
+        except (KeyError, TypeError):
+            uri = None
+
+        try:
+            # resolved item keep its document in 'data'
+            file_path = uri_to_path(uri or params["data"]["uri"])
+        except (KeyError, TypeError):
+            # handler raise 'InvalidParams' in worker process
+            return ()
+
+        return (cls._to_snapshot(session, session.get_document(file_path)),)
+
+    @staticmethod
+    def _to_snapshot(session: Session, document: Document) -> DocumentSnapshot:
+        return DocumentSnapshot(
+            document.workspace_path,
+            document.file_path,
+            document.language_id,
+            document.version,
+            document.text,
+            session.position_encoding,
+            session.client_capabilities,
+        )
+
+    def _wait_result(
+        self,
+        worker: _Worker,
+        request_id: int,
+        future: Future,
+        token: CancellationToken,
+    ) -> Any:
+        while True:
+            try:
+                return future.result(timeout=self.poll_interval)
+            except TimeoutError:
+                pass
+
+            if token.is_canceled():
+                # result of running handler is discarded
+                self._cancel(worker, request_id, future)
+                token.check()
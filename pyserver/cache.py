@@ -0,0 +1,180 @@
+"""cache"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+LOGGER = logging.getLogger("pyserver")
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# directory of caches persisted between sessions
+CACHE_DIRECTORY = Path.home() / ".pyserver" / "cache"
+
+
+class LRUCache(Generic[K, V]):
+    """Thread safe least recently used cache
+
+    Cache hold at most 'maxsize' items. If 'max_cost' defined, least recently
+    used items also evicted while total cost of items, measured by
+    'get_cost' (e.g. approximate memory size), exceed 'max_cost'.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        max_cost: Optional[int] = None,
+        get_cost: Callable[[V], int] = lambda value: 1,
+    ):
+        self.maxsize = max(maxsize, 1)
+        self.max_cost = max_cost
+        self.get_cost = get_cost
+        self.cost = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[K, V]" = OrderedDict()
+        self._costs: Dict[K, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._items
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._items[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """get cache size and hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "cost": self.cost,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._insert(key, value)
+
+    def _insert(self, key: K, value: V) -> None:
+        self._remove(key)
+        self._items[key] = value
+        self._costs[key] = cost = self.get_cost(value)
+        self.cost += cost
+        while len(self._items) > self.maxsize or (
+            self.max_cost is not None and self.cost > self.max_cost
+        ):
+            self._remove(next(iter(self._items)))
+
+    def _remove(self, key: K) -> None:
+        if key in self._items:
+            del self._items[key]
+            self.cost -= self._costs.pop(key)
+
+    def setdefault(self, key: K, factory: Callable[[], V]) -> V:
+        """get value of key, value created by 'factory' if not cached
+
+        Factory called without lock, if the key added by another thread
+        meanwhile, the value of that thread is returned.
+        """
+        if (value := self.get(key)) is not None:
+            return value
+
+        value = factory()
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            self._insert(key, value)
+        return value
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            value = self._items.get(key, default)
+            self._remove(key)
+            return value
+
+    def remove_if(self, predicate: Callable[[K], bool]) -> None:
+        """remove items which key match predicate"""
+        with self._lock:
+            for key in [k for k in self._items if predicate(k)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._costs.clear()
+            self.cost = 0
+
+
+class FileCache:
+    """Versioned cache of JSON values persisted in files of 'directory'
+
+    Each key stored in its own file with a 'validator' (e.g. source mtime),
+    stored value is invalid if its validator or cache version changed.
+    File is replaced atomically, cache may be shared by processes.
+    """
+
+    def __init__(self, directory: Path, version: str):
+        self.directory = directory
+        self.version = version
+
+    def _get_file(self, key: str) -> Path:
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return self.directory / f"{name}.json"
+
+    def load(self, key: str, validator: Any) -> Optional[Any]:
+        """load value of key, return None if not stored or invalid"""
+        try:
+            content = json.loads(self._get_file(key).read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            LOGGER.debug("Error load cache of %r: '%s'", key, err)
+            return None
+
+        if content.get("version") != self.version or content.get("key") != key:
+            return None
+        if content.get("validator") != validator:
+            return None
+        return content.get("value")
+
+    def save(self, key: str, validator: Any, value: Any) -> None:
+        content = {
+            "version": self.version,
+            "key": key,
+            "validator": validator,
+            "value": value,
+        }
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # write to temporary file, readers never see partial content
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file:
+                    json.dump(content, file)
+                os.replace(temp_path, self._get_file(key))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as err:
+            LOGGER.debug("Error save cache of %r: '%s'", key, err)
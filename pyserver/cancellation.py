@@ -0,0 +1,70 @@
+"""request cancellation"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Type
+
+from pyserver import errors
+
+
+class CancellationToken:
+    """Cancellation token
+
+    Long running provider check the token at its computation boundaries
+    and stop working as soon as the token canceled.
+
+    Token with 'timeout' expired after 'timeout' seconds, provider should
+    return partial result after the token expired.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self._event = threading.Event()
+        self._error: Type[errors.JSONRPCException] = errors.RequestCancelled
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def cancel(
+        self, error: Type[errors.JSONRPCException] = errors.RequestCancelled
+    ) -> None:
+        """cancel token, 'error' raised on next check"""
+        self._error = error
+        self._event.set()
+
+    def is_canceled(self) -> bool:
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """remaining seconds before expired, None if no timeout"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def is_expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def check(self) -> None:
+        """raise error if token canceled"""
+        if self._event.is_set():
+            raise self._error("operation canceled")
+
+
+_current_token: ContextVar[CancellationToken] = ContextVar("current_token")
+
+
+def get_token() -> CancellationToken:
+    """get token of current request, return a never canceled token if not set"""
+    try:
+        return _current_token.get()
+    except LookupError:
+        return CancellationToken()
+
+
+@contextmanager
+def use_token(token: CancellationToken) -> Iterator[CancellationToken]:
+    """set token of current request"""
+    reset_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset_token)
@@ -1,50 +1,82 @@
 """Document object"""
 
 from collections import namedtuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 from typing import List
 
 from pyserver import errors
+from pyserver.position import DEFAULT_ENCODING
+from pyserver.text_buffer import TextBuffer
+
+LineCharacter = namedtuple("LineCharacter", ["line", "character"])
 
 
-@dataclass
+@dataclass(frozen=True)
 class Document:
-    """Document object"""
+    """Document object
+
+    Document is an immutable snapshot of a document version. Change create
+    a new document which share unchanged text buffer pieces.
+    """
 
     workspace_path: Path
     file_path: Path
     language_id: str
     version: int
-    text: str = ""
+    buffer: TextBuffer = field(default_factory=TextBuffer, repr=False)
     is_saved: bool = False
 
-
-LineCharacter = namedtuple("LineCharacter", ["line", "character"])
-
-
-class OffsetCalculator:
-    def __init__(self, text: str) -> None:
-        self.lines = text.splitlines(keepends=True)
-        self.text_len = len(text)
-
-    def get_offset(self, row: int, column: int) -> int:
-        line_offset = sum([len(l) for l in self.lines[:row]])
-        return line_offset + column
-
-    def get_rowcolumn(self, offset: int) -> tuple[int, int]:
-        calculated_len = 0
-        for index, line in enumerate(self.lines):
-            if (temp := calculated_len + len(line)) and temp < offset:
-                calculated_len = temp
-                continue
-            return index, offset - calculated_len
-        return 0, 0
-
-
-def _update_text(old_text: str, changes: List[dict]) -> str:
-    temp = old_text
-
+    @classmethod
+    def from_text(
+        cls,
+        workspace_path: Path,
+        file_path: Path,
+        language_id: str,
+        version: int,
+        text: str,
+    ) -> "Document":
+        return cls(workspace_path, file_path, language_id, version, TextBuffer(text))
+
+    @property
+    def text(self) -> str:
+        """document text, only joined from buffer if requested"""
+        return str(self.buffer)
+
+    def get_line(self, line: int) -> str:
+        """get text of line without line break"""
+        return self.buffer.get_line(line)
+
+    def clamp_position(self, line: int, character: int) -> LineCharacter:
+        """limit position to the document text"""
+        return LineCharacter(
+            *self.buffer.get_position(self.buffer.get_offset(line, character))
+        )
+
+    def decode_position(
+        self, line: int, character: int, encoding: str
+    ) -> LineCharacter:
+        """convert client position to position in document text"""
+        character = self.buffer.from_client_character(line, character, encoding)
+        return self.clamp_position(line, character)
+
+    def encode_position(
+        self, line: int, character: int, encoding: str
+    ) -> LineCharacter:
+        """convert position in document text to client position"""
+        character = self.buffer.to_client_character(line, character, encoding)
+        return LineCharacter(line, character)
+
+
+def _get_offset(buffer: TextBuffer, position: LineCharacter, encoding: str) -> int:
+    line, character = position
+    character = buffer.from_client_character(line, character, encoding)
+    return buffer.get_offset(line, character)
+
+
+def _update_buffer(
+    buffer: TextBuffer, changes: List[dict], encoding: str
+) -> TextBuffer:
     for change in changes:
         try:
             start = LineCharacter(**change["range"]["start"])
@@ -54,17 +86,24 @@ def _update_text(old_text: str, changes: List[dict]) -> str:
         except KeyError as err:
             raise errors.InvalidParams(f"invalid params {err}") from err
 
-        calculator = OffsetCalculator(temp)
-        start_offset = calculator.get_offset(*start)
-        end_offset = calculator.get_offset(*end)
-
-        temp = f"{temp[:start_offset]}{new_text}{temp[end_offset:]}"
-
-    return temp
-
-
-def apply_document_changes(document: Document, content_change: List[dict], /) -> None:
-    """"""
-    new_text = _update_text(document.text, content_change)
-    document.text = new_text
-    document.is_saved = False
+        start_offset = _get_offset(buffer, start, encoding)
+        end_offset = _get_offset(buffer, end, encoding)
+        buffer = buffer.replace(start_offset, end_offset, new_text)
+
+    return buffer
+
+
+def apply_document_changes(
+    document: Document,
+    content_change: List[dict],
+    version: int,
+    encoding: str = DEFAULT_ENCODING,
+    /,
+) -> Document:
+    """return new document version with changes applied"""
+    return replace(
+        document,
+        version=version,
+        buffer=_update_buffer(document.buffer, content_change, encoding),
+        is_saved=False,
+    )
@@ -1,27 +1,41 @@
 """document completion"""
 
+import heapq
+import logging
+import os
 import sys
+import threading
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from html import escape
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple, Collection
 
-from jedi import Script, Project
+import jedi
+from jedi import Script, settings
 from jedi.api.classes import Completion
 from parso.tree import Leaf
 
 from pyserver import errors
+from pyserver.cache import CACHE_DIRECTORY, FileCache, LRUCache
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path
+from pyserver.position import to_client_character, to_client_position
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
+LOGGER = logging.getLogger("pyserver")
+
 
 @dataclass
 class CompletionParams:
     workspace_path: Path
     file_path: Path
-    text: str
     line: int
     character: int
+    # cursor offset in document text
+    offset: int
+    position_encoding: str
 
     def jedi_rowcol(self):
         # jedi use one based line index
@@ -35,25 +49,45 @@ ENDMARKER_TYPE = frozenset({"endmarker", "newline"})
 CLOSING_PUNCTUATION = frozenset({":", ")", "]", "}"})
 # 1st element of sys.path is working directory
 LIBRARY_PATH = tuple(sys.path[1:])
+# stored items of other format, jedi or python version are ignored
+ITEM_CACHE_VERSION = "2-jedi{}-python{}.{}".format(jedi.__version__, *sys.version_info)
+# approximate memory size of cached items, in bytes
+DEFAULT_ITEM_CACHE_BUDGET = 32 * 1024 * 1024
+# completion list truncated to the best matching items
+DEFAULT_COMPLETION_LIMIT = 100
 
 
 class CompletionItem:
-    __slots__ = ["text", "signature_params", "signature_returns", "kind"]
+    __slots__ = [
+        "text",
+        "signature_params",
+        "signature_returns",
+        "kind",
+        "documentation",
+    ]
 
     def __init__(
         self,
         text: str,
-        signature_params: str,
+        signature_params: Optional[str],
         signature_returns: str,
         kind: str,
+        documentation: Optional[str] = None,
     ):
         self.text = text
+        # None if signature not resolved yet
         self.signature_params = signature_params
         self.signature_returns = signature_returns
         self.kind = kind
+        # None if documentation not resolved yet
+        self.documentation = documentation
+
+    @property
+    def is_resolved(self) -> bool:
+        return self.signature_params is not None
 
     def signature(self) -> str:
-        if self.kind not in CALLABLE_TYPE:
+        if self.kind not in CALLABLE_TYPE or not self.is_resolved:
             return ""
         returns = f" -> {self.signature_returns}" if self.signature_returns else ""
         return f"{self.text}({self.signature_params}){returns}"
@@ -61,34 +95,298 @@ class CompletionItem:
     def insert_text(
         self, append_bracket: bool = False, full_signature: bool = False
     ) -> str:
+        """text inserted on completion
+
+        Function called without arguments inserted with brackets only if its
+        signature resolved, e.g. cached or defined without parameters.
+        """
         if self.kind != "function":
             return self.text
         if not append_bracket:
             return self.text
-        if full_signature and self.signature_params[:4] == "self":
+        if full_signature and (self.signature_params or "")[:4] == "self":
             return f"{self.signature()}:"
-        if not self.signature_params:
+        if self.signature_params == "":
             return f"{self.text}()"
         return f"{self.text}(${{1}})"
 
+    def get_size(self) -> int:
+        """approximate memory size of item and its cache entry"""
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.text)
+            + sys.getsizeof(self.signature_params)
+            + sys.getsizeof(self.signature_returns)
+            + sys.getsizeof(self.documentation)
+            # key tuple and cache entry
+            + 200
+        )
+
+
+# (module path, module mtime, name)
+ItemKey = Tuple[str, int, str]
+
+
+class LibraryItemStore:
+    """Completion items of library modules persisted between sessions
+
+    Items of a module stored together, keyed by module path. Stored items
+    are invalid if the module modified.
+    """
+
+    def __init__(self, cache: FileCache):
+        self.cache = cache
+        # module path and mtime which stored items loaded
+        self._loaded: Set[Tuple[str, int]] = set()
+        # items not persisted yet
+        self._pending: Dict[Tuple[str, int], Dict[str, CompletionItem]] = defaultdict(
+            dict
+        )
+        self._lock = threading.Lock()
+
+    def load(self, module_path: str, mtime: int) -> Dict[str, CompletionItem]:
+        """load stored items of module, empty if already loaded"""
+
+        with self._lock:
+            if (module_path, mtime) in self._loaded:
+                return {}
+            self._loaded.add((module_path, mtime))
+
+        values = self.cache.load(module_path, mtime) or {}
+        try:
+            return {name: CompletionItem(name, *v) for name, v in values.items()}
+        except (AttributeError, TypeError):
+            return {}
+
+    def add(self, module_path: str, mtime: int, item: CompletionItem) -> None:
+        with self._lock:
+            self._pending[(module_path, mtime)][item.text] = item
+
+    def save(self) -> None:
+        """persist pending items along with stored items of the module"""
+
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(dict)
+
+        for (module_path, mtime), items in pending.items():
+            # items may be stored by other process
+            values = self.cache.load(module_path, mtime) or {}
+            for item in items.values():
+                values[item.text] = [
+                    item.signature_params,
+                    item.signature_returns,
+                    item.kind,
+                    item.documentation,
+                ]
+            self.cache.save(module_path, mtime, values)
+
+
+def _is_identifier_char(char: str) -> bool:
+    return bool(char) and f"a{char}".isidentifier()
+
+
+def _match_prefix(name: str, prefix: str) -> Optional[Tuple[int, int]]:
+    """fuzzy match name with completion prefix like jedi, lower score is better
+
+    Return None if characters of prefix not found in order.
+    """
+
+    if name.startswith(prefix):
+        return (0, 0)
+    if settings.case_insensitive_completion:
+        name = name.lower()
+        prefix = prefix.lower()
+        if name.startswith(prefix):
+            return (1, 0)
+
+    # count characters skipped between matched characters
+    position = -1
+    skipped = 0
+    for char in prefix:
+        found = name.find(char, position + 1)
+        if found < 0:
+            return None
+        skipped += found - position - 1
+        position = found
+    return (2, skipped)
+
+
+@dataclass
+class CompletionResult:
+    """Completion candidates at cursor, reused while identifier typed"""
+
+    items: List[CompletionItem]
+    text_edit_range: dict
+    is_append_bracket: bool
+    is_override: bool
+    # every candidate matching 'prefix' is in items
+    is_complete: bool
+    # document text and cursor offset
+    text: str
+    offset: int
+    line: int
+    # typed identifier before cursor, replaced identifier range at line
+    prefix: str = ""
+    start: int = 0
+    end: int = 0
+
+    # maximum number of items sent to client, set by configure()
+    limit = DEFAULT_COMPLETION_LIMIT
+
+    def refine(
+        self, text: str, offset: int, line: int, line_text: str, encoding: str
+    ) -> Optional["CompletionResult"]:
+        """get result after typed identifier extended
+
+        Return None if the document changed otherwise, candidates must be
+        computed again.
+        """
+
+        added_length = len(text) - len(self.text)
+        if not (
+            self.is_complete
+            and line == self.line
+            and added_length > 0
+            and offset == self.offset + added_length
+        ):
+            return None
+
+        # text only inserted at cursor
+        if not (
+            text.startswith(self.text[: self.offset])
+            and text.endswith(self.text[self.offset :])
+        ):
+            return None
+
+        prefix = self.prefix + text[self.offset : offset]
+        if not prefix.isidentifier():
+            return None
+
+        end = self.end + added_length
+        return replace(
+            self,
+            items=[item for item in self.items if _match_prefix(item.text, prefix)],
+            text_edit_range={
+                "start": {
+                    "line": line,
+                    "character": to_client_character(line_text, self.start, encoding),
+                },
+                "end": {
+                    "line": line,
+                    "character": to_client_character(line_text, end, encoding),
+                },
+            },
+            text=text,
+            offset=offset,
+            prefix=prefix,
+            end=end,
+        )
+
+    def _rank(self, item: CompletionItem) -> tuple:
+        name = item.text
+        return (
+            _match_prefix(name, self.prefix) or (3, 0),
+            # private names last like jedi
+            name.startswith("__"),
+            name.startswith("_"),
+            name.lower(),
+        )
+
+    def get_best_items(self, limit: int) -> Tuple[List[CompletionItem], bool]:
+        """get best matching items sorted by rank, True if items truncated"""
+
+        if len(self.items) > limit:
+            return heapq.nsmallest(limit, self.items, key=self._rank), True
+        return sorted(self.items, key=self._rank), False
+
+    def to_completion_list(
+        self, data: Any, item_defaults: Collection[str] = ()
+    ) -> Optional[Dict[str, Any]]:
+        """build completion list, 'data' sent back to resolve item
+
+        Fields shared by all items sent once if in 'item_defaults'
+        supported by client.
+        """
+        if not self.items:
+            # client request again if candidates not complete
+            return None if self.is_complete else {"isIncomplete": True, "items": []}
+
+        defaults = {}
+        if "editRange" in item_defaults:
+            defaults["editRange"] = self.text_edit_range
+        if "insertTextFormat" in item_defaults:
+            defaults["insertTextFormat"] = 2  # insert format = snippet
+        if "data" in item_defaults:
+            defaults["data"] = data
+
+        items, is_truncated = self.get_best_items(self.limit)
+        # keep ranked order in client
+        width = len(str(len(items)))
+        # transform as rpc
+        result = {
+            # client request again while typing if list truncated
+            "isIncomplete": not self.is_complete or is_truncated,
+            "items": [
+                self._build_item(item, f"{rank:0{width}d}", data, defaults)
+                for rank, item in enumerate(items)
+            ],
+        }
+        if defaults:
+            result["itemDefaults"] = defaults
+        return result
+
+    def _build_item(
+        self, item: CompletionItem, sort_text: str, data: Any, defaults: dict
+    ) -> dict:
+        # fields equal to label or protocol default omitted
+        result = {
+            "label": item.text,
+            "kind": CompletionProvider.kind_map[item.kind],
+            "sortText": sort_text,
+        }
+
+        insert_text = item.insert_text(self.is_append_bracket, self.is_override)
+        if "editRange" not in defaults:
+            result["textEdit"] = {
+                "range": self.text_edit_range,
+                "newText": insert_text,
+            }
+        elif insert_text != item.text:
+            result["textEditText"] = insert_text
+
+        if "insertTextFormat" not in defaults:
+            result["insertTextFormat"] = 2  # insert format = snippet
+        if "data" not in defaults:
+            result["data"] = data
+
+        # unresolved signature computed on resolve
+        if detail := item.signature():
+            result["detail"] = detail
+        return result
+
 
 class CompletionProvider:
-    def __init__(self, params: CompletionParams):
+    def __init__(
+        self, params: CompletionParams, script: Script, token: CancellationToken
+    ):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
         self.text_edit_range = {}
         self.is_append_bracket = False
         self.is_override = False
+        # typed identifier before cursor, None if unknown
+        self.prefix: Optional[str] = None
+        self.replaced_columns = (params.character, params.character)
+        # modification time of library modules, checked once per request
+        self.module_mtimes: Dict[str, Optional[int]] = {}
 
     def execute(self) -> List[Completion]:
         jedi_rowcol = self.params.jedi_rowcol()
         cursor_leaf = self.script._module_node.get_leaf_for_position(jedi_rowcol)
 
         self.text_edit_range = self._get_replaced_text_range(jedi_rowcol, cursor_leaf)
+        self.prefix = self._get_prefix(cursor_leaf)
 
         self.is_append_bracket = self._check_is_append_bracket(
             self.script._code_lines[self.params.line],  # Text line at cursor location
@@ -99,7 +397,8 @@ class CompletionProvider:
         if not self._is_return_completion(cursor_leaf):
             return []
 
-        return self.script.complete(*jedi_rowcol)
+        # candidates ranked and truncated by the completion result
+        return self.script.complete(*jedi_rowcol, fuzzy=True)
 
     @staticmethod
     def _is_return_completion(leaf: Optional[Leaf]) -> bool:
@@ -167,6 +466,25 @@ class CompletionProvider:
             return True
         return False
 
+    def _get_prefix(self, leaf: Optional[Leaf]) -> Optional[str]:
+        """get identifier typed before cursor, None if not known"""
+
+        line = self.params.line
+        character = self.params.character
+        line_text = self.script._code_lines[line]
+        if leaf and leaf.type == "name":
+            start, end = leaf.start_pos, leaf.end_pos
+            # identifier range must be at cursor line
+            if not (start[0] == end[0] == line + 1 and start[1] <= character):
+                return None
+            self.replaced_columns = (start[1], end[1])
+            return line_text[start[1] : character]
+
+        # identifier typed at cursor must be a new identifier
+        if _is_identifier_char(line_text[character - 1 : character]):
+            return None
+        return ""
+
     def _get_replaced_text_range(
         self, cursor_location: tuple, leaf: Optional[Leaf]
     ) -> dict:
@@ -179,9 +497,11 @@ class CompletionProvider:
             start = end = cursor_location
 
         # jedi use 1-based line index
+        lines = self.script._code_lines
+        encoding = self.params.position_encoding
         return {
-            "start": {"line": start[0] - 1, "character": start[1]},
-            "end": {"line": end[0] - 1, "character": end[1]},
+            "start": to_client_position(lines, start[0] - 1, start[1], encoding),
+            "end": to_client_position(lines, end[0] - 1, end[1], encoding),
         }
 
     kind_map = defaultdict(
@@ -199,13 +519,47 @@ class CompletionProvider:
         },
     )
 
-    cached_items = dict()
+    # library items, outdated items of modified module evicted eventually
+    cached_items: LRUCache[ItemKey, CompletionItem] = LRUCache(
+        sys.maxsize, DEFAULT_ITEM_CACHE_BUDGET, CompletionItem.get_size
+    )
+    library_items = LibraryItemStore(
+        FileCache(CACHE_DIRECTORY / "completion", ITEM_CACHE_VERSION)
+    )
+
+    def _get_module_mtime(self, module_path: str) -> Optional[int]:
+        try:
+            return self.module_mtimes[module_path]
+        except KeyError:
+            pass
 
-    def get_completion_item(self, completion: Completion) -> CompletionItem:
+        try:
+            mtime = os.stat(module_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        self.module_mtimes[module_path] = mtime
+        return mtime
+
+    def _load_library_items(self, module_path: str, mtime: int) -> None:
+        for name, item in self.library_items.load(module_path, mtime).items():
+            key = (module_path, mtime, name)
+            if key not in self.cached_items:
+                self.cached_items.put(key, item)
+
+    def get_completion_item(
+        self, completion: Completion, resolve: bool = False
+    ) -> CompletionItem:
         text = completion.name
         kind = completion.type
         params = ""
         annotation = ""
+        documentation = None
+
+        if resolve:
+            try:
+                documentation = completion.docstring(raw=True)
+            except Exception:
+                documentation = ""
 
         # only get signatures for class and function
         if kind in CALLABLE_TYPE:
@@ -225,62 +579,136 @@ class CompletionProvider:
                 except Exception:
                     annotation = ""
 
-        return CompletionItem(text, params, annotation, kind)
+        return CompletionItem(text, params, annotation, kind, documentation)
+
+    @staticmethod
+    def _get_parameterless_item(completion: Completion) -> Optional[CompletionItem]:
+        """get item of function defined without parameters, None otherwise
+
+        Signature read from syntax tree without inference.
+        """
+
+        if completion.type != "function":
+            return None
+        tree_name = getattr(completion._name, "tree_name", None)
+        funcdef = tree_name.parent if tree_name else None
+        if (
+            not funcdef
+            or funcdef.type != "funcdef"
+            or funcdef.name is not tree_name
+            # decorator may change signature
+            or funcdef.parent.type == "decorated"
+            or funcdef.get_params()
+        ):
+            return None
+
+        annotation = ""
+        if (node := funcdef.annotation) is not None:
+            annotation = " ".join(node.get_code().split())
+        return CompletionItem(completion.name, "", annotation, completion.type)
+
+    def _get_item(
+        self, completion: Completion, resolve: bool = False
+    ) -> CompletionItem:
+        """get item, signature and documentation only inferred if 'resolve'"""
 
-    def _build_item(self, completion: Completion) -> dict:
         name = completion.name
+        kind = completion.type
+        # only callable has signature, module path of imported name
+        # may be expensive to infer
+        if kind not in CALLABLE_TYPE and not resolve:
+            return CompletionItem(name, "", "", kind)
+
         module_path = str(completion.module_path)
+        key = None
+        if (
+            module_path.startswith(LIBRARY_PATH)
+            and (mtime := self._get_module_mtime(module_path)) is not None
+        ):
+            key = (module_path, mtime, name)
+            if key not in self.cached_items:
+                # items stored by previous session
+                self._load_library_items(module_path, mtime)
+
+            item = self.cached_items.get(key)
+            if item and (item.documentation is not None or not resolve):
+                return item
+
+        # overriding method inserted with its signature
+        if not (resolve or self.is_override):
+            return self._get_parameterless_item(completion) or CompletionItem(
+                name, None, "", kind
+            )
 
-        if module_path.startswith(LIBRARY_PATH):
+        item = self.get_completion_item(completion, resolve)
+        if key:
             # store library item into cache
-            try:
-                # load
-                item = self.cached_items[(module_path, name)]
-
-            except (KeyError, AttributeError):
-                item = self.get_completion_item(completion)
-                # store
-                if item.kind in CALLABLE_TYPE:
-                    self.cached_items[(module_path, name)] = item
-        else:
-            item = self.get_completion_item(completion)
+            self.cached_items.put(key, item)
+            self.library_items.add(module_path, mtime, item)
+        return item
 
-        insert_text = item.insert_text(self.is_append_bracket, self.is_override)
-        return {
-            "label": item.text,
-            "labelDetails": {},
-            "kind": self.kind_map[item.kind],
-            "preselect": False,
-            "sortText": item.text,
-            "filterText": item.text,
-            "detail": item.signature(),
-            "insertTextFormat": 2,  # insert format = snippet
-            "textEdit": {
-                "range": self.text_edit_range,
-                "newText": insert_text,
-            },
-        }
-
-    def get_completions(self) -> Dict[str, Any]:
+    def get_result(self) -> CompletionResult:
         try:
             candidates = self.execute()
+            is_complete = self.prefix is not None
         except Exception:
             candidates = []
+            is_complete = False
+
+        items = []
+        for completion in candidates:
+            # signature of overriding method inference may take a while
+            self.token.check()
+            items.append(self._get_item(completion))
+
+        # candidates computed again on next request if time budget exhausted
+        if self.token.is_expired():
+            is_complete = False
+
+        self.library_items.save()
+        LOGGER.debug("Completion item cache: %s", self.cached_items.get_stats())
+
+        start, end = self.replaced_columns
+        return CompletionResult(
+            items,
+            self.text_edit_range,
+            self.is_append_bracket,
+            self.is_override,
+            is_complete,
+            self.script._code,
+            self.params.offset,
+            self.params.line,
+            self.prefix or "",
+            start,
+            end,
+        )
 
-        if not candidates:
-            return None
+    def resolve(self, item: dict) -> dict:
+        """add signature and documentation to completion item"""
+
+        name = item.get("label")
+        candidates = self.execute()
+        if not (completion := next((c for c in candidates if c.name == name), None)):
+            return item
+
+        resolved = self._get_item(completion, resolve=True)
+        self.library_items.save()
+
+        item = dict(item)
+        if detail := resolved.signature():
+            item["detail"] = detail
+        if docstring := resolved.documentation:
+            item["documentation"] = {
+                "kind": "markdown",
+                "value": f"<pre>{escape(docstring, quote=False)}</pre>",
+            }
+        return item
 
-        # transform as rpc
-        return {
-            "isIncomplete": True,
-            "itemDefaults": {
-                "editRange": {
-                    "start": {"line": 0, "character": 0},
-                    "end": {"line": 0, "character": 0},
-                }
-            },
-            "items": [self._build_item(completion) for completion in candidates],
-        }
+
+def configure(item_cache_budget: int, limit: int) -> None:
+    """set memory budget of cached items, in bytes, and completion list limit"""
+    CompletionProvider.cached_items.max_cost = max(item_cache_budget, 0)
+    CompletionResult.limit = max(limit, 1)
 
 
 def textdocument_completion(session: Session, params: dict) -> None:
@@ -292,12 +720,67 @@ def textdocument_completion(session: Session, params: dict) -> None:
         raise errors.InvalidParams(f"invalid params: {err}") from err
 
     document = session.get_document(file_path)
+    encoding = session.position_encoding
+    line, character = document.decode_position(line, character, encoding)
+    offset = document.buffer.get_offset(line, character)
+
+    # completion position, item resolved from position of document
+    data = {"uri": params["textDocument"]["uri"], "line": line, "character": character}
+
+    item_defaults = (
+        session.client_capabilities.get("textDocument", {})
+        .get("completion", {})
+        .get("completionList", {})
+        .get("itemDefaults", ())
+    )
+
+    # typed identifier extended, filter previous candidates
+    if (previous := session.completion_results.get(file_path)) and (
+        result := previous.refine(
+            document.text, offset, line, document.get_line(line), encoding
+        )
+    ):
+        session.completion_results.put(file_path, result)
+        return result.to_completion_list(data, item_defaults)
+
+    params = CompletionParams(
+        document.workspace_path,
+        document.file_path,
+        line,
+        character,
+        offset,
+        encoding,
+    )
+    with use_script(session, document) as script:
+        service = CompletionProvider(params, script, get_token())
+        result = service.get_result()
+
+    session.completion_results.put(file_path, result)
+    return result.to_completion_list(data, item_defaults)
+
+
+def completionitem_resolve(session: Session, params: dict) -> dict:
+    item = params
+    try:
+        data = item["data"]
+        file_path = uri_to_path(data["uri"])
+        line = data["line"]
+        character = data["character"]
+    except (KeyError, TypeError) as err:
+        raise errors.InvalidParams(f"invalid params: {err}") from err
+
+    document = session.get_document(file_path)
+    # document may be changed after completion
+    line, character = document.clamp_position(line, character)
+    offset = document.buffer.get_offset(line, character)
     params = CompletionParams(
         document.workspace_path,
         document.file_path,
-        document.text,
         line,
         character,
+        offset,
+        session.position_encoding,
     )
-    service = CompletionProvider(params)
-    return service.get_completions()
+    with use_script(session, document) as script:
+        service = CompletionProvider(params, script, get_token())
+        return service.resolve(item)
@@ -2,13 +2,16 @@
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence
 
-from jedi import Script, Project
+from jedi import Script
 from jedi.api.classes import Name
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path, path_to_uri
+from pyserver.position import to_client_position
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
 
@@ -16,9 +19,9 @@ from pyserver.session import Session
 class DefinitionParams:
     workspace_path: Path
     file_path: Path
-    text: str
     line: int
     character: int
+    position_encoding: str
 
     def jedi_rowcol(self):
         # jedi use one based line index
@@ -26,13 +29,12 @@ class DefinitionParams:
 
 
 class DefinitionProvider:
-    def __init__(self, params: DefinitionParams):
+    def __init__(
+        self, params: DefinitionParams, script: Script, token: CancellationToken
+    ):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
 
     def execute(self) -> List[Name]:
         leaf = self.script._module_node.get_leaf_for_position(self.params.jedi_rowcol())
@@ -44,11 +46,26 @@ class DefinitionProvider:
         row, col = self.params.jedi_rowcol()
         return self.script.goto(row, col, follow_imports=True)
 
+    def _get_code_lines(self, name: Name) -> Sequence[str]:
+        if name.module_path == self.params.file_path:
+            return self.script._code_lines
+        try:
+            return name._name.get_root_context().code_lines
+        except Exception:
+            return []
+
     def build_items(self, names: List[Name]):
         # jedi rows start with 1, columns start with 0
         default = (1, 0)
+        found = False
 
         for name in names:
+            # definition position may require inference
+            self.token.check()
+            # return resolved definitions if time budget exhausted
+            if found and self.token.is_expired():
+                return
+
             try:
                 path = name.module_path
                 start = name.get_definition_start_position() or default
@@ -60,13 +77,18 @@ class DefinitionProvider:
             if not path:
                 continue
 
+            lines = self._get_code_lines(name)
+            encoding = self.params.position_encoding
             item = {
                 "uri": path_to_uri(str(path)),
                 "range": {
-                    "start": {"line": start[0] - 1, "character": start[1]},
-                    "end": {"line": end[0] - 1, "character": end[1]},
+                    "start": to_client_position(
+                        lines, start[0] - 1, start[1], encoding
+                    ),
+                    "end": to_client_position(lines, end[0] - 1, end[1], encoding),
                 },
             }
+            found = True
             yield item
 
     def get_definition(self) -> Dict[str, Any]:
@@ -92,12 +114,15 @@ def textdocument_definition(session: Session, params: dict) -> None:
         raise errors.InvalidParams(f"invalid params: {err}") from err
 
     document = session.get_document(file_path)
+    encoding = session.position_encoding
+    line, character = document.decode_position(line, character, encoding)
     params = DefinitionParams(
         document.workspace_path,
         document.file_path,
-        document.text,
         line,
         character,
+        encoding,
     )
-    service = DefinitionProvider(params)
-    return service.get_definition()
+    with use_script(session, document) as script:
+        service = DefinitionProvider(params, script, get_token())
+        return service.get_definition()
@@ -9,16 +9,24 @@ from typing import Dict, Any, Iterator, Optional
 from pyflakes import checker
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path, path_to_uri
+from pyserver.position import (
+    UTF8,
+    from_client_character,
+    to_client_character,
+)
 from pyserver.session import Session
+from pyserver.text_buffer import TextBuffer
 
 
 @dataclass
 class DiagnosticParams:
     workspace_path: Path
     file_path: Path
-    text: str
+    buffer: TextBuffer
     version: int
+    position_encoding: str
 
 
 KIND_ERROR = 1
@@ -38,12 +46,12 @@ class Diagnostic:
 
 
 class PyflakesDiagnostic:
-    def __init__(self, file_name: str, text: str, /):
+    def __init__(self, file_name: str, buffer: TextBuffer, /):
         self.file_name = file_name
-        self.text = text
+        self.buffer = buffer
 
     def get_diagnostic(self) -> Iterator[Diagnostic]:
-        yield from self._check(self.file_name, self.text)
+        yield from self._check(self.file_name, str(self.buffer))
 
     def _check(self, filename: str, source: str, /) -> Iterator[Diagnostic]:
         try:
@@ -71,9 +79,8 @@ class PyflakesDiagnostic:
         msg = err.args[0]
 
         # entire error line as range
-        lines = self.text.splitlines()
         start = RowCol(lineno, 0)
-        end = RowCol(lineno, len(lines[lineno]))
+        end = RowCol(lineno, len(self.buffer.get_line(lineno)))
         text_range = TextRange(start, end)
         yield Diagnostic(KIND_ERROR, filename, text_range, msg, "pyflakes")
 
@@ -92,9 +99,23 @@ class PyflakesDiagnostic:
             msg = message.message % message.message_args
 
             leaf = leaf_getter.get_leaf_at(RowCol(lineno, offset))
-            text_range = get_leaf_range(leaf)
+            text_range = self._to_character_range(get_leaf_range(leaf))
             yield Diagnostic(KIND_WARNING, filename, text_range, msg, "pyflakes")
 
+    def _to_character_range(self, text_range: TextRange) -> TextRange:
+        """convert utf-8 byte column of python ast to character index"""
+
+        start, end = [
+            RowCol(
+                location.row,
+                from_client_character(
+                    self.buffer.get_line(location.row), location.column, UTF8
+                ),
+            )
+            for location in text_range
+        ]
+        return TextRange(start, end)
+
 
 class LeafGetter:
     """Get leaf from a node without check from beginning"""
@@ -180,20 +201,28 @@ def get_leaf_range(leaf: AST) -> TextRange:
 
 
 class DiagnosticProvider:
-    def __init__(self, params: DiagnosticParams):
+    def __init__(self, params: DiagnosticParams, token: CancellationToken):
         self.params = params
+        self.token = token
 
     def execute(self) -> Iterator[Diagnostic]:
-        diagnostic = PyflakesDiagnostic(self.params.file_path, self.params.text)
+        diagnostic = PyflakesDiagnostic(self.params.file_path, self.params.buffer)
         return diagnostic.get_diagnostic()
 
+    def _encode_location(self, location: RowCol) -> Dict[str, int]:
+        line = self.params.buffer.get_line(location.row)
+        character = to_client_character(
+            line, location.column, self.params.position_encoding
+        )
+        return {"line": location.row, "character": character}
+
     def build_item(self, item: Diagnostic) -> dict:
         start, end = item.text_range
 
         return {
             "range": {
-                "start": {"line": start.row, "character": start.column},
-                "end": {"line": end.row, "character": end.column},
+                "start": self._encode_location(start),
+                "end": self._encode_location(end),
             },
             "severity": item.severity,
             "source": item.source,
@@ -201,11 +230,15 @@ class DiagnosticProvider:
         }
 
     def get_diagnostics(self) -> Dict[str, Any]:
-        diagnostics = self.execute()
+        items = []
+        for diagnostic in self.execute():
+            self.token.check()
+            items.append(self.build_item(diagnostic))
+
         return {
             "uri": path_to_uri(self.params.file_path),
             "version": self.params.version,
-            "diagnostics": [self.build_item(d) for d in diagnostics],
+            "diagnostics": items,
         }
 
 
@@ -219,8 +252,9 @@ def textdocument_publishdiagnostics(session: Session, params: dict):
     params = DiagnosticParams(
         document.workspace_path,
         document.file_path,
-        document.text,
+        document.buffer,
         document.version,
+        session.position_encoding,
     )
-    service = DiagnosticProvider(params)
+    service = DiagnosticProvider(params, get_token())
     return service.get_diagnostics()
@@ -3,8 +3,12 @@
 import difflib
 from typing import Iterator, List
 
+from pyserver.position import to_client_character
 
-def _get_text_changes(old: str, new: str, delta: int = 3) -> Iterator[dict]:
+
+def _get_text_changes(
+    old: str, new: str, encoding: str, delta: int = 3
+) -> Iterator[dict]:
     """get text changes"""
 
     line_separator = "\n"
@@ -42,7 +46,9 @@ def _get_text_changes(old: str, new: str, delta: int = 3) -> Iterator[dict]:
                 "start": {"line": start_removed_line, "character": 0},
                 "end": {
                     "line": end_remove_line,
-                    "character": len(removed_lines[-1]),
+                    "character": to_client_character(
+                        removed_lines[-1], len(removed_lines[-1]), encoding
+                    ),
                 },
             },
             "newText": insert_text,
@@ -50,6 +56,6 @@ def _get_text_changes(old: str, new: str, delta: int = 3) -> Iterator[dict]:
         }
 
 
-def get_text_changes(old: str, new: str) -> List[dict]:
-    """get text changes"""
-    return list(_get_text_changes(old, new, delta=1))
+def get_text_changes(old: str, new: str, encoding: str) -> List[dict]:
+    """get text changes, character in 'encoding' code unit"""
+    return list(_get_text_changes(old, new, encoding, delta=1))
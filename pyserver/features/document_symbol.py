@@ -4,11 +4,14 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Dict, Any
 
-from jedi import Script, Project
+from jedi import Script
 from jedi.api.classes import Name
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path
+from pyserver.position import to_client_position
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
 
@@ -16,17 +19,14 @@ from pyserver.session import Session
 class SymbolParams:
     workspace_path: Path
     file_path: Path
-    text: str
+    position_encoding: str
 
 
 class DocumentSymbolProvider:
-    def __init__(self, params: SymbolParams):
+    def __init__(self, params: SymbolParams, script: Script, token: CancellationToken):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
 
     def execute(self) -> List[Name]:
         return self.script.get_names(all_scopes=True, definitions=True)
@@ -48,12 +48,14 @@ class DocumentSymbolProvider:
         start = name.line, name.column
         end = name.line, name.column + len(name_str)
 
+        lines = self.script._code_lines
+        encoding = self.params.position_encoding
         return {
             "name": name.name,
             "kind": self.SYMBOL_KIND[name.type],
             "range": {
-                "start": {"line": start[0] - 1, "character": start[1]},
-                "end": {"line": end[0] - 1, "character": end[1]},
+                "start": to_client_position(lines, start[0] - 1, start[1], encoding),
+                "end": to_client_position(lines, end[0] - 1, end[1], encoding),
             },
         }
 
@@ -66,8 +68,16 @@ class DocumentSymbolProvider:
         if not candidates:
             return None
 
+        items = []
+        for symbol in candidates:
+            self.token.check()
+            # return built items if time budget exhausted
+            if items and self.token.is_expired():
+                break
+            items.append(self._build_item(symbol))
+
         # transform as rpc
-        return [self._build_item(symbol) for symbol in candidates]
+        return items
 
 
 def textdocument_symbol(session: Session, params: dict) -> None:
@@ -80,7 +90,8 @@ def textdocument_symbol(session: Session, params: dict) -> None:
     params = SymbolParams(
         document.workspace_path,
         document.file_path,
-        document.text,
+        session.position_encoding,
     )
-    service = DocumentSymbolProvider(params)
-    return service.get_symbols()
+    with use_script(session, document) as script:
+        service = DocumentSymbolProvider(params, script, get_token())
+        return service.get_symbols()
@@ -8,6 +8,7 @@ import black
 
 from pyserver.features import diffutils
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path
 from pyserver.session import Session
 
@@ -16,11 +17,13 @@ from pyserver.session import Session
 class FormattingParams:
     file_path: Path
     text: str
+    position_encoding: str
 
 
 class FormattingProvider:
-    def __init__(self, params: FormattingParams):
+    def __init__(self, params: FormattingParams, token: CancellationToken):
         self.params = params
+        self.token = token
 
     def execute(self) -> str:
         text = self.params.text
@@ -32,10 +35,13 @@ class FormattingProvider:
 
     def get_formatted(self) -> List[Dict[str, Any]]:
         formatted_str = self.execute()
+        self.token.check()
 
         if formatted_str == self.params.text:
             return None
-        return diffutils.get_text_changes(self.params.text, formatted_str)
+        return diffutils.get_text_changes(
+            self.params.text, formatted_str, self.params.position_encoding
+        )
 
 
 def textdocument_formatting(session: Session, params: dict) -> None:
@@ -48,6 +54,7 @@ def textdocument_formatting(session: Session, params: dict) -> None:
     params = FormattingParams(
         document.file_path,
         document.text,
+        session.position_encoding,
     )
-    service = FormattingProvider(params)
+    service = FormattingProvider(params, get_token())
     return service.get_formatted()
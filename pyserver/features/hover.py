@@ -7,12 +7,15 @@ from pathlib import Path
 from textwrap import indent
 from typing import List, Dict, Any
 
-from jedi import Script, Project
+from jedi import Script
 from jedi.api.classes import Name, Signature
 from parso.tree import Leaf
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path
+from pyserver.position import to_client_position
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
 
@@ -20,9 +23,9 @@ from pyserver.session import Session
 class HoverParams:
     workspace_path: Path
     file_path: Path
-    text: str
     line: int
     character: int
+    position_encoding: str
 
     def jedi_rowcol(self):
         # jedi use one based line index
@@ -30,13 +33,10 @@ class HoverParams:
 
 
 class HoverProvider:
-    def __init__(self, params: HoverParams):
+    def __init__(self, params: HoverParams, script: Script, token: CancellationToken):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
         self.leaf_range = {}
 
     def execute(self) -> List[Name]:
@@ -51,12 +51,13 @@ class HoverProvider:
         row, col = self.params.jedi_rowcol()
         return self.script.help(row, col)
 
-    @staticmethod
-    def _get_leaf_range(leaf: Leaf) -> Dict[str, Any]:
+    def _get_leaf_range(self, leaf: Leaf) -> Dict[str, Any]:
         start, end = leaf.start_pos, leaf.end_pos
+        lines = self.script._code_lines
+        encoding = self.params.position_encoding
         return {
-            "start": {"line": start[0] - 1, "character": start[1]},
-            "end": {"line": end[0] - 1, "character": end[1]},
+            "start": to_client_position(lines, start[0] - 1, start[1], encoding),
+            "end": to_client_position(lines, end[0] - 1, end[1], encoding),
         }
 
     @staticmethod
@@ -81,7 +82,8 @@ class HoverProvider:
         if name.type != "module" and name.module_name != "__main__":
             buffer.write(f"module: `{name.module_name}`\n\n")
 
-        if name.type in {"class", "function"}:
+        # skip signature inference if time budget exhausted
+        if name.type in {"class", "function"} and not self.token.is_expired():
             try:
                 signatures = name.get_signatures()
                 signatures = [self.signature_to_string(s) for s in signatures]
@@ -105,6 +107,8 @@ class HoverProvider:
         if not candidates:
             return None
 
+        self.token.check()
+
         # transform as rpc
         name_object = candidates[0]
 
@@ -127,12 +131,15 @@ def textdocument_hover(session: Session, params: dict) -> None:
         raise errors.InvalidParams(f"invalid params: {err}") from err
 
     document = session.get_document(file_path)
+    encoding = session.position_encoding
+    line, character = document.decode_position(line, character, encoding)
     params = HoverParams(
         document.workspace_path,
         document.file_path,
-        document.text,
         line,
         character,
+        encoding,
     )
-    service = HoverProvider(params)
-    return service.get_documentation()
+    with use_script(session, document) as script:
+        service = HoverProvider(params, script, get_token())
+        return service.get_documentation()
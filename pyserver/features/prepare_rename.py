@@ -4,10 +4,13 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Any, Optional
 
-from jedi import Script, Project
+from jedi import Script
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path
+from pyserver.position import to_client_position
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
 
@@ -15,9 +18,9 @@ from pyserver.session import Session
 class PrepareRenameParams:
     workspace_path: Path
     file_path: Path
-    text: str
     line: int
     character: int
+    position_encoding: str
 
     def jedi_rowcol(self):
         # jedi use one based line index
@@ -34,13 +37,12 @@ class Identifier:
 
 
 class PrepareRenameProvider:
-    def __init__(self, params: PrepareRenameParams):
+    def __init__(
+        self, params: PrepareRenameParams, script: Script, token: CancellationToken
+    ):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
 
     def execute(self) -> Optional[Identifier]:
         # get leaf position
@@ -53,6 +55,8 @@ class PrepareRenameProvider:
         # check object reference
         names = self.script.goto(*self.params.jedi_rowcol(), follow_imports=True)
         for name in names:
+            self.token.check()
+
             if name.in_builtin_module():
                 raise ValueError("unable rename 'builtin'")
 
@@ -70,16 +74,16 @@ class PrepareRenameProvider:
         if not candidate:
             return None
 
+        lines = self.script._code_lines
+        encoding = self.params.position_encoding
         return {
             "range": {
-                "start": {
-                    "line": candidate.start_line,
-                    "character": candidate.start_character,
-                },
-                "end": {
-                    "line": candidate.end_line,
-                    "character": candidate.end_character,
-                },
+                "start": to_client_position(
+                    lines, candidate.start_line, candidate.start_character, encoding
+                ),
+                "end": to_client_position(
+                    lines, candidate.end_line, candidate.end_character, encoding
+                ),
             },
             "placeholder": candidate.text,
         }
@@ -94,12 +98,15 @@ def textdocument_preparerename(session: Session, params: dict) -> None:
         raise errors.InvalidParams(f"invalid params: {err}") from err
 
     document = session.get_document(file_path)
+    encoding = session.position_encoding
+    line, character = document.decode_position(line, character, encoding)
     params = PrepareRenameParams(
         document.workspace_path,
         document.file_path,
-        document.text,
         line,
         character,
+        encoding,
     )
-    service = PrepareRenameProvider(params)
-    return service.get_rename_target()
+    with use_script(session, document) as script:
+        service = PrepareRenameProvider(params, script, get_token())
+        return service.get_rename_target()
@@ -4,13 +4,15 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Any
 
-from jedi import Script, Project
+from jedi import Script
 from jedi.api.refactoring import ChangedFile, Refactoring, RefactoringError
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path, path_to_uri
 from pyserver.features import diffutils
 from pyserver.document import Document
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
 
@@ -19,23 +21,20 @@ class RenameParams:
     session: Session
     workspace_path: Path
     file_path: Path
-    text: str
     line: int
     character: int
     new_name: str
+    position_encoding: str
 
     def jedi_rowcol(self):
         return (self.line + 1, self.character)
 
 
 class RenameProvider:
-    def __init__(self, params: RenameParams):
+    def __init__(self, params: RenameParams, script: Script, token: CancellationToken):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
 
     def execute(self) -> Refactoring:
         row, col = self.params.jedi_rowcol()
@@ -44,7 +43,6 @@ class RenameProvider:
         except RefactoringError as err:
             raise errors.InvalidRequest(repr(err)) from err
 
-
     def build_item(self, path: Path, changed_file: ChangedFile) -> Dict[str, Any]:
         # File Resource Changes
         old = changed_file._from_path
@@ -67,26 +65,34 @@ class RenameProvider:
             document = self.params.session.get_document(path)
         except errors.InvalidResource:
             temp_text = path.read_text()
-            document = Document(self.params.workspace_path, path, "", 0, temp_text)
+            document = Document.from_text(
+                self.params.workspace_path, path, "", 0, temp_text
+            )
 
         return {
             "textDocument": {
                 "version": document.version,
                 "uri": path_to_uri(document.file_path),
             },
-            "edits": diffutils.get_text_changes(document.text, new_text),
+            "edits": diffutils.get_text_changes(
+                document.text, new_text, self.params.position_encoding
+            ),
         }
 
     def get_changes(self) -> Dict[str, Any]:
         refactored = self.execute()
+        self.token.check()
+
         changed_files = refactored.get_changed_files()
         if not changed_files:
             return None
 
-        changes = [
-            self.build_item(path, changed_file)
-            for path, changed_file in changed_files.items()
-        ]
+        changes = []
+        for path, changed_file in changed_files.items():
+            # text diff computed for each file
+            self.token.check()
+            changes.append(self.build_item(path, changed_file))
+
         return {"documentChanges": changes}
 
 
@@ -100,14 +106,17 @@ def textdocument_rename(session: Session, params: dict) -> None:
         raise errors.InvalidParams(f"invalid params: {err}") from err
 
     document = session.get_document(file_path)
+    encoding = session.position_encoding
+    line, character = document.decode_position(line, character, encoding)
     params = RenameParams(
         session,
         document.workspace_path,
         document.file_path,
-        document.text,
         line,
         character,
         new_name,
+        encoding,
     )
-    service = RenameProvider(params)
-    return service.get_changes()
+    with use_script(session, document) as script:
+        service = RenameProvider(params, script, get_token())
+        return service.get_changes()
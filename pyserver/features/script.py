@@ -0,0 +1,87 @@
+"""shared jedi script"""
+
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from jedi import Project, Script
+
+from pyserver.cancellation import get_token
+from pyserver.document import Document
+from pyserver.session import Session
+
+# interval to check request cancelation while waiting jedi
+POLL_INTERVAL = 0.05
+
+# Jedi is not thread safe. Scripts share the environment subprocess, the
+# diff parser tree of each path (updated in place) and lazily loaded
+# builtins, jedi is used by one thread at a time. Analysis processes
+# ('--processes') use jedi in parallel.
+_jedi_lock = threading.RLock()
+
+
+@contextmanager
+def _lock_jedi() -> Iterator[None]:
+    """acquire jedi lock, stop waiting if request canceled"""
+
+    token = get_token()
+    while not _jedi_lock.acquire(timeout=POLL_INTERVAL):
+        token.check()
+    try:
+        yield
+    finally:
+        _jedi_lock.release()
+
+
+def preload_module(name: str, project: Optional[Project] = None) -> None:
+    """load module, parsed module tree is cached for later scripts"""
+
+    with _lock_jedi():
+        # complete module attribute to parse the module
+        code = f"import {name}\n{name}."
+        Script(code, project=project).complete(2, len(name) + 1)
+
+
+def get_project(session: Session) -> Project:
+    """get jedi Project of workspace, shared by all features
+
+    Project keep its environment, project rebuilt if workspace changed.
+    """
+
+    project = session.project
+    if project is None or project.path != Path(session.root_path):
+        project = Project(session.root_path)
+        session.project = project
+    return project
+
+
+def workspace_didchangeconfiguration(session: Session, params: dict) -> None:
+    # rebuild project and scripts with new configuration
+    session.project = None
+    session.script_cache.clear()
+
+
+def _get_script(session: Session, document: Document) -> Script:
+    key = (document.file_path, document.version)
+    if not (script := session.script_cache.get(key)):
+        # Jedi parse Script with parso diff parser, only region changed since
+        # the last parsed version of the path is parsed again. Scripts of a
+        # path share the parso tree updated in place, Script of other
+        # version no longer match its code.
+        session.script_cache.remove_if(lambda other: other[0] == document.file_path)
+        script = Script(
+            document.text,
+            path=document.file_path,
+            project=get_project(session),
+        )
+        session.script_cache.put(key, script)
+    return script
+
+
+@contextmanager
+def use_script(session: Session, document: Document) -> Iterator[Script]:
+    """use jedi Script of document version, shared by all features"""
+
+    with _lock_jedi():
+        yield _get_script(session, document)
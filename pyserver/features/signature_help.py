@@ -6,11 +6,13 @@ from pathlib import Path
 from textwrap import indent
 from typing import List, Dict, Any
 
-from jedi import Script, Project
+from jedi import Script
 from jedi.api.classes import Signature
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, get_token
 from pyserver.uri import uri_to_path
+from pyserver.features.script import use_script
 from pyserver.session import Session
 
 
@@ -18,9 +20,9 @@ from pyserver.session import Session
 class SignatureHelpParams:
     workspace_path: Path
     file_path: Path
-    text: str
     line: int
     character: int
+    position_encoding: str
 
     def jedi_rowcol(self):
         # jedi use one based line index
@@ -28,13 +30,12 @@ class SignatureHelpParams:
 
 
 class SignatureHelpProvider:
-    def __init__(self, params: SignatureHelpParams):
+    def __init__(
+        self, params: SignatureHelpParams, script: Script, token: CancellationToken
+    ):
         self.params = params
-        self.script = Script(
-            self.params.text,
-            path=self.params.file_path,
-            project=Project(self.params.workspace_path),
-        )
+        self.token = token
+        self.script = script
 
     def execute(self) -> List[Signature]:
         row, col = self.params.jedi_rowcol()
@@ -78,6 +79,8 @@ class SignatureHelpProvider:
         if not candidates:
             return None
 
+        self.token.check()
+
         return {
             "signatures": self.build_item(candidates),
             "activeSignature": 0,
@@ -93,12 +96,15 @@ def textdocument_signaturehelp(session: Session, params: dict) -> None:
         raise errors.InvalidParams(f"invalid params: {err}") from err
 
     document = session.get_document(file_path)
+    encoding = session.position_encoding
+    line, character = document.decode_position(line, character, encoding)
     params = SignatureHelpParams(
         document.workspace_path,
         document.file_path,
-        document.text,
         line,
         character,
+        encoding,
     )
-    service = SignatureHelpProvider(params)
-    return service.get_signature()
+    with use_script(session, document) as script:
+        service = SignatureHelpProvider(params, script, get_token())
+        return service.get_signature()
@@ -0,0 +1,58 @@
+"""warm up analysis caches while server is idle"""
+
+from pyserver import errors
+from pyserver.cancellation import get_token
+from pyserver.features.script import get_project, preload_module, use_script
+from pyserver.session import Session
+from pyserver.uri import uri_to_path
+
+# modules imported by most python code, 'builtins' used by every script
+PRELOAD_MODULES = (
+    "builtins",
+    "os",
+    "sys",
+    "typing",
+    "collections",
+    "functools",
+    "itertools",
+    "re",
+    "json",
+    "pathlib",
+    "dataclasses",
+    "logging",
+)
+
+
+def warm_up_workspace(session: Session, params: dict) -> None:
+    # project may be unavailable in analysis process
+    project = get_project(session) if session.root_path else None
+    token = get_token()
+    for name in PRELOAD_MODULES:
+        token.check()
+        preload_module(name, project)
+
+
+def warm_up_document(session: Session, params: dict) -> None:
+    try:
+        file_path = uri_to_path(params["textDocument"]["uri"])
+    except KeyError as err:
+        raise errors.InvalidParams(f"invalid params: {err}") from err
+
+    document = session.get_document(file_path)
+    token = get_token()
+    with use_script(session, document) as script:
+        positions = [
+            path[-1].start_pos
+            for node in script._module_node.iter_imports()
+            for path in node.get_paths()
+        ]
+
+    # jedi locked for each import, waiting request use jedi in between
+    for position in positions:
+        token.check()
+        if session.working_documents.get(file_path) is not document:
+            # document changed, positions outdated
+            return
+        with use_script(session, document) as script:
+            # resolved imports kept by the shared script
+            script.infer(*position)
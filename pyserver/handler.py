@@ -1,14 +1,15 @@
 """command handler"""
 
+from dataclasses import replace
 from pathlib import Path
 from typing import Callable, Dict, Any, Optional
 
 from pyserver import errors
 from pyserver.document import apply_document_changes
+from pyserver.position import negotiate_encoding
 from pyserver.uri import uri_to_path
 from pyserver.session import Session, SessionStatus
 
-
 MethodName = str
 Params = dict | list | None
 SessionHandleFunction = Callable[[Session, Params], Any]
@@ -77,11 +78,15 @@ class InitializeManager:
             raise errors.InternalError("root path/uri must a directory")
 
         session.root_path = root_path
+        session.client_capabilities = params.get("capabilities") or {}
+        session.position_encoding = negotiate_encoding(
+            session.client_capabilities.get("general", {}).get("positionEncodings")
+        )
         session.status = SessionStatus.Initializing
 
         return {
             "capabilities": {
-                "positionEncoding": "utf-8",
+                "positionEncoding": session.position_encoding,
                 "textDocumentSync": {
                     "openClose": True,
                     "change": 2,
@@ -93,7 +98,7 @@ class InitializeManager:
                 "completionProvider": {
                     "triggerCharacters": ["[", "{", "(", ",", "."],
                     "allCommitCharacters": [],
-                    "resolveProvider": False,
+                    "resolveProvider": True,
                     "completionItem": {"labelDetailsSupport": False},
                     "workDoneProgress": False,
                 },
@@ -210,7 +215,7 @@ class DocumentSynchronizer:
             raise errors.InvalidParams(f"invalid params: {err}") from err
 
         if document := session.get_document(file_path):
-            document.is_saved = True
+            session.update_document(replace(document, is_saved=True))
 
     def didclose(self, session: Session, params: dict) -> None:
         try:
@@ -233,4 +238,8 @@ class DocumentSynchronizer:
         if version <= document.version:
             return
 
-        apply_document_changes(document, content_changes)
+        session.update_document(
+            apply_document_changes(
+                document, content_changes, version, session.position_encoding
+            )
+        )
@@ -0,0 +1,109 @@
+"""position encoding"""
+
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+UTF8 = "utf-8"
+UTF16 = "utf-16"
+UTF32 = "utf-32"
+
+# python str indexed by code point, equal to 'utf-32' code unit
+SUPPORTED_ENCODINGS = (UTF32, UTF16, UTF8)
+# encoding used if client not define position encodings
+DEFAULT_ENCODING = UTF16
+
+
+def negotiate_encoding(client_encodings: Optional[List[str]]) -> str:
+    """select position encoding supported by both client and server"""
+
+    if not client_encodings:
+        return DEFAULT_ENCODING
+
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in client_encodings:
+            return encoding
+    return DEFAULT_ENCODING
+
+
+def _get_width(char: str, encoding: str) -> int:
+    if encoding == UTF8:
+        return len(char.encode("utf-8"))
+    # non BMP character encoded as surrogate pair
+    return 2 if ord(char) > 0xFFFF else 1
+
+
+CharacterTable = Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]
+
+
+def get_character_table(text: str, encoding: str) -> CharacterTable:
+    """get index, start unit and end unit of characters wider than one unit"""
+
+    indexes = []
+    starts = []
+    ends = []
+    extra = 0
+    for index, char in enumerate(text):
+        if char.isascii() or (width := _get_width(char, encoding)) == 1:
+            continue
+
+        indexes.append(index)
+        starts.append(index + extra)
+        extra += width - 1
+        ends.append(index + extra + 1)
+
+    return tuple(indexes), tuple(starts), tuple(ends)
+
+
+def index_to_unit(table: CharacterTable, index: int) -> int:
+    """convert character index of table text to code unit"""
+
+    indexes, _, ends = table
+    if not (count := bisect_left(indexes, index)):
+        return index
+    # offset from the last wide character before 'index'
+    return ends[count - 1] + index - indexes[count - 1] - 1
+
+
+def unit_to_index(table: CharacterTable, unit: int) -> int:
+    """convert code unit of table text to character index"""
+
+    indexes, starts, ends = table
+    if not (count := bisect_left(starts, unit)):
+        return unit
+
+    last = count - 1
+    if unit < ends[last]:
+        # code unit inside of a character
+        return indexes[last]
+    return indexes[last] + 1 + unit - ends[last]
+
+
+# lines of analysis (e.g. jedi code lines) are kept between requests,
+# hash of str is computed once
+_get_line_table = lru_cache(maxsize=1024)(get_character_table)
+
+
+def to_client_character(line: str, character: int, encoding: str) -> int:
+    """convert character index of line to client code unit"""
+
+    if encoding == UTF32 or line.isascii():
+        return character
+    return index_to_unit(_get_line_table(line, encoding), character)
+
+
+def from_client_character(line: str, character: int, encoding: str) -> int:
+    """convert client code unit of line to character index"""
+
+    if encoding == UTF32 or line.isascii():
+        return character
+    return unit_to_index(_get_line_table(line, encoding), character)
+
+
+def to_client_position(
+    lines: Sequence[str], line: int, character: int, encoding: str
+) -> Dict[str, int]:
+    """build client position from line and character index of 'lines'"""
+
+    text = lines[line] if 0 <= line < len(lines) else ""
+    return {"line": line, "character": to_client_character(text, character, encoding)}
@@ -1,12 +1,30 @@
 """LSP implementation"""
 
 import logging
+import os
 import queue
 import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 from contextlib import contextmanager
-from typing import Any, Callable
+from dataclasses import asdict, dataclass, field
+from enum import IntEnum
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 from pyserver import errors
+from pyserver.cancellation import CancellationToken, use_token
 from pyserver.message import (
     Message,
     Notification,
@@ -26,69 +44,408 @@ Result = list | dict | None
 Error = dict | None
 HandleFunction = Callable[[MethodName, Params], Result]
 
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# seconds to wait document unchanged before publish diagnostics
+DEFAULT_DIAGNOSTICS_DELAY = 0.3
+# maximum number of waiting requests
+DEFAULT_QUEUE_SIZE = 64
+# seconds to wait client response for server request
+DEFAULT_SERVER_REQUEST_TIMEOUT = 30.0
+
+# server internal requests, handled while server is idle and never answered
+WARM_UP_WORKSPACE = "pyserver/warmUpWorkspace"
+WARM_UP_DOCUMENT = "pyserver/warmUpDocument"
+# server custom request, answered with request queue statistics
+REQUEST_STATS = "pyserver/requestStats"
+
+# requests which result only depend on text at the requested position,
+# result of hover, definition or signatureHelp may come from a definition
+# after the position
+POSITION_METHODS = frozenset({"textDocument/prepareRename"})
+
+
+def get_document_uri(params: Params) -> Optional[str]:
+    """get target document uri of params, return None if not available"""
+    try:
+        return params["textDocument"]["uri"]
+    except (KeyError, TypeError):
+        return None
+
+
+def merge_document_changes(
+    message: Notification, other: Message
+) -> Optional[Notification]:
+    """merge 'other' into 'message' if both change the same document
+
+    Return None if not mergeable.
+    """
+
+    if not (
+        isinstance(other, Notification) and other.method == "textDocument/didChange"
+    ):
+        return None
+
+    try:
+        if other.params["textDocument"]["uri"] != get_document_uri(message.params):
+            return None
+        changes = message.params["contentChanges"] + other.params["contentChanges"]
+    except (KeyError, TypeError):
+        return None
+
+    # changes applied in order, document version set to the latest
+    return Notification(message.method, {**other.params, "contentChanges": changes})
+
+
+def get_changed_line(params: Params) -> int:
+    """get first line modified by document changes, 0 if content replaced
+
+    Changes applied in order, lines before the smallest start line of all
+    changes are not modified.
+    """
+
+    try:
+        changes = params["contentChanges"]
+        return min(
+            (
+                change["range"]["start"]["line"] if "range" in change else 0
+                for change in changes
+            ),
+            default=0,
+        )
+    except (KeyError, TypeError):
+        return 0
+
+
+def get_warm_up_request(
+    method: MethodName, params: Params
+) -> Optional[Tuple[MethodName, Params]]:
+    """get internal request to warm up caches after notification"""
+
+    if method == "initialized":
+        return WARM_UP_WORKSPACE, {}
+    if method == "textDocument/didOpen" and (uri := get_document_uri(params)):
+        return WARM_UP_DOCUMENT, {"textDocument": {"uri": uri}}
+    return None
+
+
+class DocumentVersions:
+    """Track opened document version from synchronization notification"""
+
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+
+    def get(self, uri: Optional[str]) -> Optional[int]:
+        return self.versions.get(uri)
+
+    def update(self, method: MethodName, params: Params) -> bool:
+        """update version, return True if opened document content modified"""
+
+        try:
+            uri = params["textDocument"]["uri"]
+            if method == "textDocument/didClose":
+                self.versions.pop(uri, None)
+                return False
+
+            version = params["textDocument"]["version"]
+        except (KeyError, TypeError):
+            return False
+
+        previous = self.versions.get(uri)
+        # document only updated if version incremented
+        if previous is not None and version <= previous:
+            return False
+
+        self.versions[uri] = version
+        return previous is not None
+
 
 class ServerTerminated(Exception):
     """ServerTerminated"""
 
 
+class Priority(IntEnum):
+    """Request priority, lower value handled first"""
+
+    Interactive = 0
+    Normal = 1
+    Background = 2
+    # server internal request, only handled if no other request waiting
+    Idle = 3
+
+    @classmethod
+    def from_string(cls, name: str) -> "Priority":
+        try:
+            return cls[name.capitalize()]
+        except KeyError as err:
+            raise ValueError(f"invalid priority {name!r}") from err
+
+
+@dataclass
+class QueuedRequest:
+    request: Request
+    priority: Priority
+    # target document version when request received
+    version: Optional[int] = None
+    queued_time: float = field(default_factory=time.monotonic)
+    # server internal request is not answered
+    internal: bool = False
+
+    def is_outdated(self, uri: str, version: int, changed_line: int = 0) -> bool:
+        """check if request target previous version of document
+
+        Position request before 'changed_line' is still valid.
+        """
+        if not (
+            self.version is not None
+            and self.version < version
+            and get_document_uri(self.request.params) == uri
+        ):
+            return False
+
+        if self.request.method not in POSITION_METHODS:
+            return True
+        try:
+            return self.request.params["position"]["line"] >= changed_line
+        except (KeyError, TypeError):
+            return True
+
+    def effective_priority(self, now: float, aging_interval: float) -> float:
+        """priority raised by one level for every 'aging_interval' seconds waiting
+
+        Idle request priority is not raised, it never compete with other request.
+        """
+        if self.priority is Priority.Idle:
+            return float(self.priority)
+        return self.priority - (now - self.queued_time) / aging_interval
+
+    def is_superseded_by(self, other: "QueuedRequest") -> bool:
+        """check if newer request on the same method and document received"""
+        uri = get_document_uri(self.request.params)
+        return (
+            uri is not None
+            and self.request.method == other.request.method
+            and uri == get_document_uri(other.request.params)
+        )
+
+
+@dataclass
+class RequestStats:
+    """Request queue statistics"""
+
+    received: int = 0
+    handled: int = 0
+    # older waiting request replaced by newer request
+    superseded: int = 0
+    # waiting request dropped because queue is full
+    shed: int = 0
+    max_queue_depth: int = 0
+
+
 class RequestManager:
-    """RequestHandler executed outside main loop to make request cancelable"""
+    """RequestHandler executed outside main loop to make request cancelable
+
+    Requests are handled by a pool of worker threads. Requests targeting the
+    same document are started in the order they are received, only requests
+    for methods in 'readonly_methods' may run along with each other.
+
+    Jedi is not thread safe, worker threads use jedi one at a time. A slow
+    jedi request (e.g. rename) still delays other jedi requests, only
+    non jedi work runs in parallel. Features run in analysis processes
+    ('ProcessBackend') use jedi in parallel.
+
+    Ready requests are picked by priority. Waiting request priority is aged
+    so background requests are not starved by interactive requests.
+
+    Waiting request superseded by newer request on the same method and
+    document. If the queue is full, the lowest priority waiting request is
+    shed. Superseded and shed requests answered with 'ServerCancelled'.
+
+    Internal idle requests (e.g. warm up caches) only started if no client
+    request is waiting or running, and canceled when a client request is
+    received.
+    """
+
+    # methods which only read the document
+    readonly_methods = frozenset(
+        {
+            "textDocument/completion",
+            "textDocument/hover",
+            "textDocument/definition",
+            "textDocument/signatureHelp",
+            "textDocument/documentSymbol",
+            "textDocument/prepareRename",
+            WARM_UP_DOCUMENT,
+        }
+    )
+
+    # seconds waiting to raise priority by one level
+    aging_interval = 0.5
 
     def __init__(
         self,
         handle_function: HandleFunction,
         response_callback: Callable[[Id, Result, Error], None],
+        workers: int = DEFAULT_WORKERS,
+        priorities: Optional[Dict[MethodName, Priority]] = None,
+        deadlines: Optional[Dict[MethodName, float]] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
     ):
         self.handle_function = handle_function
         self.send_response = response_callback
+        self.workers = max(workers, 1)
+        self.priorities = priorities or {}
+        # seconds to handle request before its token expired
+        self.deadlines = deadlines or {}
+        self.queue_size = max(queue_size, 1)
+        self.stats = RequestStats()
+
+        # waiting requests, ordered by arrival
+        self.request_queue: List[QueuedRequest] = []
+        # in process requests
+        self.running_requests: Dict[Id, QueuedRequest] = {}
+        # cancellation token of in process requests
+        self.request_tokens: Dict[Id, CancellationToken] = {}
+        # 'request_queue' and 'running_requests' changes are guarded by
+        # '_condition', workers wait on it until a request is ready
+        self._condition = threading.Condition()
+        self._idle_count = 0
+        # idle requests canceled by client request, queued again when stopped
+        self._preempted_ids: Set[Id] = set()
+
+    def add(self, message: Request, version: Optional[int] = None):
+        """add request, 'version' is the target document version"""
+        priority = self.priorities.get(message.method, Priority.Normal)
+        self._add_item(QueuedRequest(message, priority, version))
+
+    def add_idle(self, method: MethodName, params: Params):
+        """add internal request handled while no client request waiting"""
+        with self._condition:
+            self._idle_count += 1
+            # internal id never equal to client request id
+            request_id = ("idle", self._idle_count)
+        request = Request(request_id, method, params)
+        self._add_item(QueuedRequest(request, Priority.Idle, internal=True))
+
+    def _add_item(self, item: QueuedRequest):
+        with self._condition:
+            if not item.internal:
+                self.stats.received += 1
+                self._preempt_idle()
+
+            superseded = [q for q in self.request_queue if q.is_superseded_by(item)]
+            for queued in superseded:
+                self.request_queue.remove(queued)
+            self.stats.superseded += len(superseded)
+
+            self.request_queue.append(item)
+
+            shed = []
+            if len(self.request_queue) > self.queue_size:
+                shed.append(self._pop_lowest_priority())
+                self.stats.shed += 1
+
+            self.stats.max_queue_depth = max(
+                self.stats.max_queue_depth, len(self.request_queue)
+            )
+            self._log_state()
+            self._condition.notify()
+
+        self._send_canceled(superseded + shed, errors.ServerCancelled)
+
+    def _preempt_idle(self):
+        """cancel running idle requests when client request received"""
+
+        # idle request may hold resources needed by client request, e.g. jedi
+        for running in self.running_requests.values():
+            if running.priority is Priority.Idle:
+                self.request_tokens[running.request.id].cancel(errors.ServerCancelled)
+                self._preempted_ids.add(running.request.id)
+
+    def _pop_lowest_priority(self) -> QueuedRequest:
+        now = time.monotonic()
+        # newest request picked if priority equal
+        lowest = max(
+            reversed(self.request_queue),
+            key=lambda q: q.effective_priority(now, self.aging_interval),
+        )
+        self.request_queue.remove(lowest)
+        return lowest
+
+    def get_stats(self) -> dict:
+        """get request queue statistics"""
+        with self._condition:
+            return {
+                **asdict(self.stats),
+                "queue_depth": len(self.request_queue),
+                "running": len(self.running_requests),
+            }
 
-        self.request_queue = queue.Queue()
+    def cancel(self, request_id: Id):
+        with self._condition:
+            if token := self.request_tokens.get(request_id):
+                token.cancel()
+                return
 
-        self.canceled_requests = set()
-        self.in_process_id = -1
-        self.canceled_request_lock = threading.Lock()
-        self.detach_queue_lock = threading.Lock()
+            for item in self.request_queue:
+                if item.request.id == request_id:
+                    self.request_queue.remove(item)
+                    break
+            else:
+                # request may be done
+                return
 
-    def add(self, message: Request):
-        with self.detach_queue_lock:
-            self.request_queue.put(message)
+        self._send_canceled([item])
 
-    def cancel(self, request_id: Id):
-        with self.canceled_request_lock:
-            self.canceled_requests.add(request_id)
+    def cancel_outdated(self, uri: str, version: int, changed_line: int = 0):
+        """cancel requests which result invalid in new version of document"""
 
-    def cancel_all(self):
-        self.cancel(self.in_process_id)
+        with self._condition:
+            for item in self.running_requests.values():
+                if item.is_outdated(uri, version, changed_line):
+                    self.request_tokens[item.request.id].cancel(errors.ContentModified)
 
-        with self.detach_queue_lock:
-            while not self.request_queue.empty():
-                self.request_queue.get_nowait()
+            detached = [
+                item
+                for item in self.request_queue
+                if item.is_outdated(uri, version, changed_line)
+            ]
+            for item in detached:
+                self.request_queue.remove(item)
 
-    def _check_canceled(self, request_id: Id):
-        # 'canceled_requests' data may be changed during iteration
-        with self.canceled_request_lock:
-            if request_id not in self.canceled_requests:
-                return
+        self._send_canceled(detached, errors.ContentModified)
 
-            self.canceled_requests.remove(request_id)
-            raise errors.RequestCancelled(f'request canceled "{request_id}"')
+    def _send_canceled(
+        self,
+        items: List[QueuedRequest],
+        error_class: Type[errors.JSONRPCException] = errors.RequestCancelled,
+    ):
+        for item in items:
+            if item.internal:
+                LOGGER.debug("Internal request %r dropped.", item.request.method)
+                continue
+            request = item.request
+            error = error_class(f'request canceled "{request.id}"')
+            self.send_response(request.id, None, errors.transform_error(error))
 
     @contextmanager
-    def check_cancelation(self, request_id: int):
-        self._check_canceled(request_id)
-        yield
-        self._check_canceled(request_id)
-
-    def handle(self, request: Request):
+    def check_cancelation(self, token: CancellationToken):
+        token.check()
+        # token may be checked by provider during handle
+        with use_token(token):
+            yield
+        token.check()
+
+    def handle(self, request: Request, token: Optional[CancellationToken] = None):
         result, error = None, None
+        token = token or CancellationToken()
 
         try:
-            with self.check_cancelation(request.id):
-                self.in_process_id = request.id
+            with self.check_cancelation(token):
                 result = self.handle_function(request.method, request.params)
 
         except (
             errors.RequestCancelled,
+            errors.ServerCancelled,
             errors.InvalidParams,
             errors.ContentModified,
             errors.InvalidResource,
@@ -106,85 +463,296 @@ class RequestManager:
 
         self.send_response(request.id, result, errors.transform_error(error))
 
+    def handle_internal(self, request: Request, token: CancellationToken):
+        """handle internal request, errors are only logged"""
+        try:
+            with self.check_cancelation(token):
+                self.handle_function(request.method, request.params)
+
+        except (errors.RequestCancelled, errors.ServerCancelled):
+            LOGGER.debug("Internal request %r canceled.", request.method)
+
+        except Exception as err:
+            LOGGER.debug(
+                "Error handle internal request %r: '%s'",
+                request.method,
+                err,
+                exc_info=True,
+            )
+
+    def _is_exclusive(self, request: Request) -> bool:
+        return request.method not in self.readonly_methods
+
+    def _is_background(self, request: Request) -> bool:
+        return self.priorities.get(request.method) is Priority.Background
+
+    def _pop_ready_request(self) -> Optional[QueuedRequest]:
+        """pop highest priority request which is not blocked by other request"""
+
+        running_uris = set()
+        exclusive_running_uris = set()
+        background_running = 0
+        for item in self.running_requests.values():
+            request = item.request
+            if item.priority is Priority.Idle or self._is_background(request):
+                background_running += 1
+            if uri := get_document_uri(request.params):
+                running_uris.add(uri)
+                if self._is_exclusive(request):
+                    exclusive_running_uris.add(uri)
+
+        # keep a worker available for non background request
+        background_ready = background_running < max(self.workers - 1, 1)
+        # idle request waits until every client request finished
+        idle_ready = not self.running_requests and all(
+            item.priority is Priority.Idle for item in self.request_queue
+        )
+
+        # documents target of previous waiting requests
+        waiting_uris = set()
+        exclusive_waiting_uris = set()
+
+        now = time.monotonic()
+        selected: Optional[QueuedRequest] = None
+        selected_priority = 0.0
+
+        for item in self.request_queue:
+            # waiting idle request never block client request
+            if item.priority is Priority.Idle and not idle_ready:
+                continue
+
+            request = item.request
+            uri = get_document_uri(request.params)
+            is_exclusive = self._is_exclusive(request)
+
+            if not uri:
+                is_ready = True
+            elif is_exclusive:
+                is_ready = not (uri in running_uris or uri in waiting_uris)
+            else:
+                is_ready = not (
+                    uri in exclusive_running_uris or uri in exclusive_waiting_uris
+                )
+
+            if is_ready and (background_ready or item.priority < Priority.Background):
+                priority = item.effective_priority(now, self.aging_interval)
+                # prior waiting request selected if priority equal
+                if (not selected) or priority < selected_priority:
+                    selected, selected_priority = item, priority
+
+            if uri:
+                waiting_uris.add(uri)
+                if is_exclusive:
+                    exclusive_waiting_uris.add(uri)
+
+        if not selected:
+            return None
+
+        self.request_queue.remove(selected)
+        return selected
+
+    def _log_state(self):
+        LOGGER.debug(
+            "Request pool (%d workers): %d running, %d/%d waiting, "
+            "%d superseded, %d shed.",
+            self.workers,
+            len(self.running_requests),
+            len(self.request_queue),
+            self.queue_size,
+            self.stats.superseded,
+            self.stats.shed,
+        )
+
     def _run_task(self):
-        while request := self.request_queue.get():
-            self.handle(request)
+        while True:
+            with self._condition:
+                while not (item := self._pop_ready_request()):
+                    self._condition.wait()
+                request = item.request
+                self.running_requests[request.id] = item
+                token = CancellationToken(self.deadlines.get(request.method))
+                self.request_tokens[request.id] = token
+
+            try:
+                if item.internal:
+                    self.handle_internal(request, token)
+                else:
+                    self.handle(request, token)
+            finally:
+                with self._condition:
+                    del self.running_requests[request.id]
+                    del self.request_tokens[request.id]
+                    if not item.internal:
+                        self.stats.handled += 1
+                    elif request.id in self._preempted_ids:
+                        self._preempted_ids.remove(request.id)
+                        self.request_queue.append(item)
+                    # blocked requests may be ready now
+                    self._condition.notify_all()
 
     def run(self):
-        thread = threading.Thread(target=self._run_task, daemon=True)
-        thread.start()
+        LOGGER.debug("Start request pool with %d workers.", self.workers)
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run_task, name=f"request-worker-{index}", daemon=True
+            )
+            thread.start()
+
+
+class ResponseError(Exception):
+    """Client respond server request with error"""
+
+    def __init__(self, error: dict):
+        super().__init__(error)
+        self.error = error
 
 
 class ServerRequestManager:
-    """Manage server request"""
+    """Manage server request
 
-    def __init__(self):
+    Each request get a future resolved by response with the same id, or
+    failed with 'TimeoutError' if response not received within timeout.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_SERVER_REQUEST_TIMEOUT):
+        self.timeout = timeout
         self.request_id = -1
-        self.method = ""
-        self._is_waiting_response = False
+        # method, future and timeout timer of waiting requests
+        self._waiting: Dict[Id, Tuple[MethodName, Future, threading.Timer]] = {}
+        self._lock = threading.Lock()
 
-    def is_waiting_response(self) -> bool:
-        """"""
-        return self._is_waiting_response
+    def add(self, method: str, timeout: Optional[float] = None) -> Tuple[int, Future]:
+        """return request id and response future for added method"""
 
-    def add(self, method: str) -> int:
-        """return request id for added method"""
+        future = Future()
+        with self._lock:
+            self.request_id += 1
+            request_id = self.request_id
 
-        self.method = method
-        self.request_id += 1
-        self._is_waiting_response = True
-        return self.request_id
+            timer = threading.Timer(
+                timeout or self.timeout, self._expire, args=(request_id,)
+            )
+            timer.daemon = True
+            self._waiting[request_id] = (method, future, timer)
 
-    def get(self, message_id: int) -> str:
-        """get method for response id"""
+        timer.start()
+        return request_id, future
+
+    def _expire(self, request_id: Id) -> None:
+        with self._lock:
+            try:
+                method, future, _ = self._waiting.pop(request_id)
+            except KeyError:
+                # response received
+                return
 
-        if message_id != self.request_id:
-            raise ValueError(f"invalid response for request ({self.request_id})")
+        LOGGER.debug("Request %r (%d) timed out.", method, request_id)
+        if future.cancelled():
+            return
+        future.set_exception(TimeoutError(f"no response for request ({request_id})"))
 
-        self._is_waiting_response = False
-        return self.method
+    def resolve(self, message: Response) -> None:
+        """resolve request future with response"""
+
+        with self._lock:
+            try:
+                method, future, timer = self._waiting.pop(message.id)
+            except KeyError:
+                LOGGER.debug("Ignore response for unknown request (%s).", message.id)
+                return
+
+        timer.cancel()
+        if future.cancelled():
+            return
+
+        if message.error:
+            LOGGER.debug(
+                "Request %r (%d) failed: %s", method, message.id, message.error
+            )
+            future.set_exception(ResponseError(message.error))
+        else:
+            future.set_result(message.result)
 
 
 class DiagnosticsPublisher:
-    """"""
+    """Publish diagnostics of changed documents
+
+    Diagnostics computed after the document unchanged for 'delay' seconds,
+    documents are checked in parallel by 'workers' threads. Only latest
+    document version is checked, checking previous version is canceled.
+    """
 
     def __init__(
         self,
         handle_function: HandleFunction,
         notification_callback: Callable[[Any, Any], None],
+        workers: int = DEFAULT_WORKERS,
+        delay: float = DEFAULT_DIAGNOSTICS_DELAY,
     ) -> None:
         self.handle_function = handle_function
         self.send_notification = notification_callback
+        self.workers = max(workers, 1)
+        self.delay = delay
 
-        # Only last added target checked.
-        self._target = None
-        self._target_lock = threading.Lock()
-        # _publish_event control next checking.
-        self._publish_event = threading.Event()
+        # params and due time of pending document
+        self._pending: Dict[str, Tuple[Params, float]] = {}
+        # cancellation token of document in checking
+        self._running: Dict[str, CancellationToken] = {}
+        self._condition = threading.Condition()
 
     def publish(self, params: dict) -> None:
-        """"""
-        with self._target_lock:
-            self._target = params
-            self._publish_event.set()
+        """schedule diagnostics for document in params"""
+        uri = get_document_uri(params)
+        with self._condition:
+            self._pending[uri] = (params, time.monotonic() + self.delay)
+            # result of previous version is outdated
+            if token := self._running.get(uri):
+                token.cancel()
+            self._condition.notify()
 
     def run(self) -> None:
         """"""
-        thread = threading.Thread(target=self._run_task, daemon=True)
-        thread.start()
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run_task, name=f"diagnostics-worker-{index}", daemon=True
+            )
+            thread.start()
+
+    def _pop_due_target(self) -> Tuple[Optional[str], Optional[float]]:
+        """pop due document, return uri or time to wait next due document"""
+
+        now = time.monotonic()
+        timeout = None
+        for uri, (_, due_time) in self._pending.items():
+            # wait until previous check canceled
+            if uri in self._running:
+                continue
+            if due_time <= now:
+                return uri, None
+            if timeout is None or due_time - now < timeout:
+                timeout = due_time - now
+
+        return None, timeout
 
     def _run_task(self):
         while True:
-            if not self._target:
-                self._publish_event.wait()
-                continue
+            with self._condition:
+                uri, timeout = self._pop_due_target()
+                while not uri:
+                    self._condition.wait(timeout)
+                    uri, timeout = self._pop_due_target()
 
-            with self._target_lock:
-                target = self._target
-                self._target = None
-                self._publish_event.clear()
+                params, _ = self._pending.pop(uri)
+                token = self._running[uri] = CancellationToken()
 
-            self._publish_diagnostics(target)
+            try:
+                with use_token(token):
+                    self._publish_diagnostics(params)
+            finally:
+                with self._condition:
+                    del self._running[uri]
+                    # pending document may be ready to check
+                    self._condition.notify_all()
 
     def _publish_diagnostics(self, params: Params):
         try:
@@ -193,6 +761,7 @@ class DiagnosticsPublisher:
             )
 
         except (
+            errors.RequestCancelled,
             errors.InvalidParams,
             errors.ContentModified,
             errors.InvalidResource,
@@ -213,27 +782,63 @@ class DiagnosticsPublisher:
 class LSPServer:
     """LSP server"""
 
-    def __init__(self, transport: Transport, handle_func: HandleFunction, /):
+    def __init__(
+        self,
+        transport: Transport,
+        handle_func: HandleFunction,
+        /,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        priorities: Optional[Dict[MethodName, Priority]] = None,
+        deadlines: Optional[Dict[MethodName, float]] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        diagnostics_delay: float = DEFAULT_DIAGNOSTICS_DELAY,
+    ):
         self.transport = transport
         self.handle_func = handle_func
+        # messages may be sent from multiple threads
+        self._send_lock = threading.Lock()
+
+        # opened document version, requests tagged with target document version
+        self.document_versions = DocumentVersions()
 
         # client request handler
-        self.request_manager = RequestManager(self.handle_func, self.send_response)
+        self.request_manager = RequestManager(
+            self.handle_func,
+            self.send_response,
+            workers,
+            priorities,
+            deadlines,
+            queue_size,
+        )
         self.server_request_manager = ServerRequestManager()
 
         # diagnostic publisher
         self.diagnostics_publisher = DiagnosticsPublisher(
-            self.handle_func, self.send_notification
+            self.handle_func, self.send_notification, workers, diagnostics_delay
         )
 
+        # messages read by reader thread, reading error put as last item
+        self.received_messages: "queue.Queue[Union[Message, Exception]]" = queue.Queue()
+        # messages taken from queue but not executed yet
+        self._unread_messages: Deque[Union[Message, Exception]] = deque()
+
     def send_message(self, message: Message):
         LOGGER.debug("Send >> %s", message)
         content = dumps(message, as_bytes=True)
-        self.transport.write(content)
+        with self._send_lock:
+            self.transport.write(content)
 
-    def send_request(self, method: MethodName, params: Params):
-        request_id = self.server_request_manager.add(method)
+    def send_request(
+        self, method: MethodName, params: Params, timeout: Optional[float] = None
+    ) -> Future:
+        """send request to client, return future of response result
+
+        The future must not be waited in message listening thread.
+        """
+        request_id, future = self.server_request_manager.add(method, timeout)
         self.send_message(Request(request_id, method, params))
+        return future
 
     def send_response(self, request_id: Id, result: Result = None, error: Error = None):
         self.send_message(Response(request_id, result, error))
@@ -247,6 +852,7 @@ class LSPServer:
         self.transport.listen_connection()
         self.request_manager.run()
         self.diagnostics_publisher.run()
+        threading.Thread(target=self._read_messages, daemon=True).start()
 
         try:
             self._listen_message()
@@ -258,21 +864,78 @@ class LSPServer:
                 "window/logMessage", {"type": 1, "message": repr(err)}
             )
 
-    def _listen_message(self):
-        """listen message"""
+    def _read_messages(self):
+        """read messages from transport until error or end of input"""
 
         while True:
             try:
                 content = self.transport.read()
-            except EOFError:
+                try:
+                    message = loads(content)
+                except ValueError as err:
+                    raise errors.ParseError(err) from err
+
+            except Exception as err:
+                self.received_messages.put(err)
+                return
+
+            LOGGER.debug("Received << %s", message)
+            self.received_messages.put(message)
+
+            if isinstance(message, Notification) and message.method == "exit":
+                # no more message, reading blocked input prevent clean shutdown
                 return
 
+    def _get_message(self, block: bool = True) -> Message:
+        """get received message, raise 'queue.Empty' if not block and no message"""
+
+        if self._unread_messages:
+            item = self._unread_messages.popleft()
+        else:
+            item = self.received_messages.get(block)
+
+        if isinstance(item, Exception):
+            # reader stopped, raise the error on every call
+            self._unread_messages.appendleft(item)
+            raise item
+        return item
+
+    def _coalesce_changes(self, message: Notification) -> Notification:
+        """merge following document changes already received"""
+
+        merged_count = 1
+        while True:
             try:
-                message = loads(content)
-            except ValueError as err:
-                raise errors.ParseError(err) from err
+                other = self._get_message(block=False)
+            except Exception:
+                # error raised at next message
+                break
 
-            LOGGER.debug("Received << %s", message)
+            if not (merged := merge_document_changes(message, other)):
+                self._unread_messages.appendleft(other)
+                break
+
+            message = merged
+            merged_count += 1
+
+        if merged_count > 1:
+            LOGGER.debug("Merged %d document changes.", merged_count)
+        return message
+
+    def _listen_message(self):
+        """listen message"""
+
+        while True:
+            try:
+                message = self._get_message()
+            except EOFError:
+                return
+
+            if (
+                isinstance(message, Notification)
+                and message.method == "textDocument/didChange"
+            ):
+                message = self._coalesce_changes(message)
             self.exec_message(message)
 
     def exec_notification(self, message: Notification):
@@ -289,25 +952,39 @@ class LSPServer:
 
         self.handle_func(method, params)
 
+        if method in {
+            "textDocument/didOpen",
+            "textDocument/didChange",
+            "textDocument/didClose",
+        }:
+            if self.document_versions.update(method, params):
+                # result of request on previous version is invalid
+                uri = get_document_uri(params)
+                self.request_manager.cancel_outdated(
+                    uri, self.document_versions.get(uri), get_changed_line(params)
+                )
+
         if method in {
             "textDocument/didOpen",
             "textDocument/didChange",
         }:
-            # cancel all current request
-            self.request_manager.cancel_all()
             # publish diagnostics
             self.diagnostics_publisher.publish(params)
 
+        if warm_up := get_warm_up_request(method, params):
+            self.request_manager.add_idle(*warm_up)
+
     def exec_request(self, message: Request):
-        self.request_manager.add(message)
+        if message.method == REQUEST_STATS:
+            # answered at once, queue may be full
+            self.send_response(message.id, self.request_manager.get_stats())
+            return
 
-    def exec_response(self, message: Response):
-        method = self.server_request_manager.get(message.id)
-        if message.error:
-            LOGGER.debug("Expected success result for request (%d).", message.id)
-            raise RuntimeError("expected success result")
+        uri = get_document_uri(message.params)
+        self.request_manager.add(message, self.document_versions.get(uri))
 
-        self.handle_func(method, message)
+    def exec_response(self, message: Response):
+        self.server_request_manager.resolve(message)
 
     def exec_message(self, message: Message) -> None:
         exec_map = {
@@ -315,14 +992,4 @@ class LSPServer:
             Request: self.exec_request,
             Response: self.exec_response,
         }
-        if (
-            self.server_request_manager.is_waiting_response()
-            and type(message) != Response
-        ):
-            LOGGER.debug(
-                "Response for request (%d) is required.",
-                self.server_request_manager.request_id,
-            )
-            raise RuntimeError("missing response")
-
         return exec_map[type(message)](message)
@@ -2,10 +2,15 @@
 
 from enum import Enum
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Tuple
 
+from pyserver.cache import LRUCache
 from pyserver.document import Document
 from pyserver.errors import InvalidResource
+from pyserver.position import DEFAULT_ENCODING
+
+# number of cached document analysis, e.g. jedi Script
+SCRIPT_CACHE_SIZE = 8
 
 
 class SessionStatus(Enum):
@@ -22,19 +27,40 @@ class Session:
         self.status: SessionStatus = SessionStatus.NotInitialized
 
         self.root_path: Path = None
+        self.client_capabilities: Dict[str, Any] = {}
+        self.position_encoding: str = DEFAULT_ENCODING
         self.working_documents: Dict[Path, Document] = {}
+        # workspace analysis project, e.g. jedi Project
+        self.project: Any = None
+        # analysis of the last analyzed version of document,
+        # keyed by (file_path, version)
+        self.script_cache: LRUCache[Tuple[Path, int], Any] = LRUCache(SCRIPT_CACHE_SIZE)
+        # last completion result of document, reused while identifier typed
+        self.completion_results: LRUCache[Path, Any] = LRUCache(SCRIPT_CACHE_SIZE)
 
     def add_document(self, file_path: Path, language_id: str, version: int, text: str):
         workspace_path = self.root_path
-        self.working_documents[file_path] = Document(
+        self.working_documents[file_path] = Document.from_text(
             workspace_path, file_path, language_id, version, text
         )
 
+    def update_document(self, document: Document):
+        """replace document with its new version
+
+        Document taken before replaced keep its own version.
+        """
+        self.working_documents[document.file_path] = document
+        self.script_cache.remove_if(
+            lambda key: key[0] == document.file_path and key[1] != document.version
+        )
+
     def remove_document(self, file_path: Path):
         try:
             del self.working_documents[file_path]
         except KeyError:
             pass
+        self.script_cache.remove_if(lambda key: key[0] == file_path)
+        self.completion_results.pop(file_path)
 
     def get_document(self, file_path: Path) -> Document:
         try:
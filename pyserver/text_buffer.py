@@ -0,0 +1,384 @@
+"""rope text buffer"""
+
+import re
+from bisect import bisect_right
+from typing import Iterator, Optional, Tuple, Union
+
+from pyserver.position import (
+    UTF8,
+    UTF16,
+    CharacterTable,
+    get_character_table,
+    index_to_unit,
+    unit_to_index,
+)
+
+# maximum text length of a rope leaf
+LEAF_SIZE = 1024
+
+# line break like parso and LSP
+_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+# encodings which character may be wider than one code unit
+_WIDE_ENCODINGS = (UTF16, UTF8)
+_ASCII_TABLES = tuple(((), (), ()) for _ in _WIDE_ENCODINGS)
+_ASCII_EXTRAS = tuple(0 for _ in _WIDE_ENCODINGS)
+
+
+def _get_extra(table: CharacterTable) -> int:
+    """get count of code units more than characters"""
+    indexes, _, ends = table
+    return ends[-1] - indexes[-1] - 1 if indexes else 0
+
+
+class _Leaf:
+    """rope leaf, hold a piece of text"""
+
+    __slots__ = ("text", "length", "line_starts", "tables", "extras")
+
+    height = 0
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        # offset of lines started inside leaf, line break ended at offset,
+        # line started after '\r' at the leaf end if next leaf not start
+        # with '\n'
+        self.line_starts = tuple(match.end() for match in _LINE_BREAK.finditer(text))
+        # wide characters table and extra code units of each wide encoding
+        if text.isascii():
+            self.tables = _ASCII_TABLES
+            self.extras = _ASCII_EXTRAS
+        else:
+            self.tables = tuple(
+                get_character_table(text, encoding) for encoding in _WIDE_ENCODINGS
+            )
+            self.extras = tuple(_get_extra(table) for table in self.tables)
+
+    @property
+    def newlines(self) -> int:
+        return len(self.line_starts)
+
+    @property
+    def starts_lf(self) -> bool:
+        return self.text[:1] == "\n"
+
+    @property
+    def ends_cr(self) -> bool:
+        return self.text[-1:] == "\r"
+
+
+class _Node:
+    """rope node, concatenation of left and right"""
+
+    __slots__ = (
+        "left",
+        "right",
+        "length",
+        "newlines",
+        "height",
+        "starts_lf",
+        "ends_cr",
+        "is_split_crlf",
+        "extras",
+    )
+
+    def __init__(self, left: "_Rope", right: "_Rope"):
+        self.left = left
+        self.right = right
+        self.length = left.length + right.length
+        self.height = max(left.height, right.height) + 1
+        self.starts_lf = left.starts_lf
+        self.ends_cr = right.ends_cr
+        # '\r\n' split between left and right is one line break,
+        # counted by right
+        self.is_split_crlf = left.ends_cr and right.starts_lf
+        self.newlines = left.newlines + right.newlines - self.is_split_crlf
+        self.extras = tuple(
+            left_extra + right_extra
+            for left_extra, right_extra in zip(left.extras, right.extras)
+        )
+
+
+_Rope = Union[_Leaf, _Node]
+
+
+def _build(text: str) -> Optional[_Rope]:
+    """build balanced rope from text"""
+
+    leaves = [
+        _Leaf(text[start : start + LEAF_SIZE])
+        for start in range(0, len(text), LEAF_SIZE)
+    ]
+
+    def build_range(start: int, end: int) -> _Rope:
+        if end - start == 1:
+            return leaves[start]
+        middle = (start + end) // 2
+        return _Node(build_range(start, middle), build_range(middle, end))
+
+    return build_range(0, len(leaves)) if leaves else None
+
+
+def _concat(left: _Rope, right: _Rope) -> _Rope:
+    """concatenate rope which height differ at most 2"""
+
+    if left.height > right.height + 1:
+        if left.left.height >= left.right.height:
+            return _Node(left.left, _Node(left.right, right))
+        return _Node(
+            _Node(left.left, left.right.left),
+            _Node(left.right.right, right),
+        )
+
+    if right.height > left.height + 1:
+        if right.right.height >= right.left.height:
+            return _Node(_Node(left, right.left), right.right)
+        return _Node(
+            _Node(left, right.left.left),
+            _Node(right.left.right, right.right),
+        )
+
+    return _Node(left, right)
+
+
+def _join(left: Optional[_Rope], right: Optional[_Rope]) -> Optional[_Rope]:
+    """join rope, result rope kept balanced"""
+
+    if not left:
+        return right
+    if not right:
+        return left
+
+    if left.height > right.height + 1:
+        return _concat(left.left, _join(left.right, right))
+    if right.height > left.height + 1:
+        return _concat(_join(left, right.left), right.right)
+
+    # merge small pieces to prevent fragmentation after many small edits
+    if (
+        isinstance(left, _Leaf)
+        and isinstance(right, _Leaf)
+        and left.length + right.length <= LEAF_SIZE
+    ):
+        return _Leaf(left.text + right.text)
+
+    return _Node(left, right)
+
+
+def _split(
+    rope: Optional[_Rope], offset: int
+) -> Tuple[Optional[_Rope], Optional[_Rope]]:
+    """split rope at offset"""
+
+    if not rope or offset <= 0:
+        return None, rope
+    if offset >= rope.length:
+        return rope, None
+
+    if isinstance(rope, _Leaf):
+        return _Leaf(rope.text[:offset]), _Leaf(rope.text[offset:])
+
+    if offset < rope.left.length:
+        left, right = _split(rope.left, offset)
+        return left, _join(right, rope.right)
+
+    left, right = _split(rope.right, offset - rope.left.length)
+    return _join(rope.left, left), right
+
+
+def _iter_leaves(rope: Optional[_Rope]) -> Iterator[_Leaf]:
+    stack = [rope] if rope else []
+    while stack:
+        node = stack.pop()
+        if isinstance(node, _Leaf):
+            yield node
+        else:
+            stack.append(node.right)
+            stack.append(node.left)
+
+
+class TextBuffer:
+    """Immutable rope text buffer
+
+    Edit return a new buffer which share unchanged pieces with the old one,
+    an edit take O(log n). Text of buffer only joined if requested.
+    """
+
+    __slots__ = ("_rope", "_text")
+
+    def __init__(self, text: str = ""):
+        self._rope = _build(text)
+        self._text: Optional[str] = text
+
+    @classmethod
+    def _from_rope(cls, rope: Optional[_Rope]) -> "TextBuffer":
+        buffer = cls.__new__(cls)
+        buffer._rope = rope
+        buffer._text = None
+        return buffer
+
+    def __len__(self) -> int:
+        return self._rope.length if self._rope else 0
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = "".join([leaf.text for leaf in _iter_leaves(self._rope)])
+        return self._text
+
+    @property
+    def line_count(self) -> int:
+        return (self._rope.newlines if self._rope else 0) + 1
+
+    def replace(self, start: int, end: int, text: str) -> "TextBuffer":
+        """return new buffer with text between 'start' and 'end' offset replaced"""
+
+        left, rest = _split(self._rope, start)
+        _, right = _split(rest, end - start)
+        return TextBuffer._from_rope(_join(_join(left, _build(text)), right))
+
+    def get_line_offset(self, line: int) -> int:
+        """get offset of line start, text length if line exceed text"""
+
+        rope = self._rope
+        if line <= 0 or not rope:
+            return 0
+        if line > rope.newlines:
+            return rope.length
+
+        offset = 0
+        while isinstance(rope, _Node):
+            # line break at the end of left not counted if split '\r\n'
+            left_newlines = rope.left.newlines - rope.is_split_crlf
+            if line <= left_newlines:
+                rope = rope.left
+            else:
+                line -= left_newlines
+                offset += rope.left.length
+                rope = rope.right
+
+        return offset + rope.line_starts[line - 1]
+
+    def get_offset(self, line: int, character: int) -> int:
+        """get offset of position, character limited to the line length"""
+
+        start = self.get_line_offset(line)
+        end = self.get_line_offset(line + 1)
+        if line + 1 < self.line_count:
+            # exclude line break
+            end -= 2 if self.get_text(end - 2, end) == "\r\n" else 1
+        return min(start + max(character, 0), max(end, start))
+
+    def get_position(self, offset: int) -> Tuple[int, int]:
+        """get (line, character) position of offset"""
+
+        rope = self._rope
+        if not rope:
+            return 0, 0
+
+        offset = min(max(offset, 0), rope.length)
+        remaining = offset
+        line = 0
+        while isinstance(rope, _Node):
+            if remaining < rope.left.length:
+                rope = rope.left
+            else:
+                line += rope.left.newlines - rope.is_split_crlf
+                remaining -= rope.left.length
+                rope = rope.right
+
+        # newlines in leaf before offset
+        if index := bisect_right(rope.line_starts, remaining):
+            line_offset = offset - remaining + rope.line_starts[index - 1]
+        else:
+            # line started before the leaf
+            line_offset = self.get_line_offset(line)
+        return line + index, offset - line_offset
+
+    def get_text(self, start: int, end: int) -> str:
+        """get text between 'start' and 'end' offset"""
+
+        if self._text is not None:
+            return self._text[start:end]
+
+        pieces = []
+        stack = [(self._rope, 0)] if self._rope else []
+        while stack:
+            rope, base = stack.pop()
+            if base >= end or base + rope.length <= start:
+                continue
+            if isinstance(rope, _Leaf):
+                pieces.append(rope.text[max(start - base, 0) : end - base])
+            else:
+                stack.append((rope.right, base + rope.left.length))
+                stack.append((rope.left, base))
+        return "".join(pieces)
+
+    def get_line(self, line: int) -> str:
+        """get text of line without line break, empty if line exceed text"""
+
+        if not 0 <= line < self.line_count:
+            return ""
+        start = self.get_line_offset(line)
+        end = self.get_line_offset(line + 1)
+        text = self.get_text(start, end)
+        if line + 1 < self.line_count:
+            # exclude line break
+            return text[:-2] if text.endswith("\r\n") else text[:-1]
+        return text
+
+    def _get_encoding_index(self, encoding: str) -> Optional[int]:
+        """index of wide encoding, None if every character is one unit"""
+
+        if not self._rope or encoding not in _WIDE_ENCODINGS:
+            return None
+        index = _WIDE_ENCODINGS.index(encoding)
+        return index if self._rope.extras[index] else None
+
+    def _to_unit(self, offset: int, index: int) -> int:
+        """get code units before offset"""
+
+        rope = self._rope
+        remaining = min(max(offset, 0), rope.length)
+        unit = 0
+        while isinstance(rope, _Node):
+            if remaining < rope.left.length:
+                rope = rope.left
+            else:
+                unit += rope.left.length + rope.left.extras[index]
+                remaining -= rope.left.length
+                rope = rope.right
+        return unit + index_to_unit(rope.tables[index], remaining)
+
+    def _to_offset(self, unit: int, index: int) -> int:
+        """get offset of code unit, offset of character if unit inside of it"""
+
+        rope = self._rope
+        offset = 0
+        while isinstance(rope, _Node):
+            left_units = rope.left.length + rope.left.extras[index]
+            if unit < left_units:
+                rope = rope.left
+            else:
+                unit -= left_units
+                offset += rope.left.length
+                rope = rope.right
+        return offset + unit_to_index(rope.tables[index], unit)
+
+    def to_client_character(self, line: int, character: int, encoding: str) -> int:
+        """convert character of line to client code unit"""
+
+        if (index := self._get_encoding_index(encoding)) is None:
+            return character
+        start = self.get_line_offset(line)
+        offset = self.get_offset(line, character)
+        return self._to_unit(offset, index) - self._to_unit(start, index)
+
+    def from_client_character(self, line: int, character: int, encoding: str) -> int:
+        """convert client code unit of line to character"""
+
+        if (index := self._get_encoding_index(encoding)) is None:
+            return character
+        start = self.get_line_offset(line)
+        unit = self._to_unit(start, index) + max(character, 0)
+        return self._to_offset(unit, index) - start
@@ -1,5 +1,6 @@
 """transport handler"""
 
+import asyncio
 import sys
 from abc import ABC, abstractmethod
 from io import BytesIO
@@ -78,3 +79,65 @@ class StandardIO(Transport):
         content_length = get_content_length(headers_buffer.getvalue())
         # read() is blocking until content_length satisfied
         return self.stdin_buffer.read(content_length)
+
+
+class AsyncTransport(ABC):
+    """asyncio transport abstraction"""
+
+    @abstractmethod
+    async def listen_connection(self) -> None:
+        """wait client connection"""
+
+    @abstractmethod
+    async def terminate(self) -> None:
+        """terminate from client"""
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        """write data to client"""
+
+    @abstractmethod
+    async def read(self) -> bytes:
+        """read data from client"""
+
+
+class AsyncStandardIO(AsyncTransport):
+    """asyncio StandardIO Transport implementation
+
+    stdin and stdout must be pipes.
+    """
+
+    def __init__(self):
+        self.reader: asyncio.StreamReader = None
+        self.writer: asyncio.StreamWriter = None
+
+    async def listen_connection(self):
+        loop = asyncio.get_running_loop()
+
+        self.reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self.reader), sys.stdin.buffer
+        )
+
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, sys.stdout.buffer
+        )
+        self.writer = asyncio.StreamWriter(transport, protocol, None, loop)
+
+    async def terminate(self) -> None:
+        """terminate"""
+        self.writer.close()
+
+    async def write(self, data: bytes):
+        self.writer.write(wrap_content(data))
+        await self.writer.drain()
+
+    async def read(self):
+        separator = CONTENT_SEPARATOR * 2
+        try:
+            headers = await self.reader.readuntil(separator)
+            content_length = get_content_length(headers)
+            return await self.reader.readexactly(content_length)
+
+        except asyncio.IncompleteReadError as err:
+            raise EOFError("stdin closed") from err
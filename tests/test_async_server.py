@@ -0,0 +1,134 @@
+"""asyncio lsp server test"""
+
+import asyncio
+import threading
+import time
+
+from pyserver import errors
+from pyserver.async_server import AsyncLSPServer
+from pyserver.cancellation import get_token
+from pyserver.message import Notification, Request, loads
+from pyserver.server import REQUEST_STATS, WARM_UP_DOCUMENT
+from pyserver.transport import AsyncTransport
+
+URI = "file:///a.py"
+PARAMS = {"textDocument": {"uri": URI}}
+
+
+class MemoryTransport(AsyncTransport):
+    """collect messages written by server"""
+
+    def __init__(self):
+        self.written = []
+
+    async def listen_connection(self):
+        pass
+
+    async def terminate(self):
+        pass
+
+    async def write(self, data: bytes):
+        self.written.append(loads(data))
+
+    async def read(self) -> bytes:
+        raise EOFError("no message")
+
+
+def create_server(handle_func=lambda method, params: None, **kwargs):
+    return AsyncLSPServer(MemoryTransport(), handle_func, **kwargs)
+
+
+class CallLog:
+    """record handled methods, slow methods sleep while handled"""
+
+    def __init__(self, slow=()):
+        self.slow = slow
+        self.items = []
+
+    def __call__(self, method, params):
+        self.items.append(("start", method))
+        if method in self.slow:
+            time.sleep(0.1)
+        self.items.append(("end", method))
+
+
+async def wait_requests(server: AsyncLSPServer):
+    if server.request_tasks:
+        await asyncio.wait(list(server.request_tasks.values()))
+
+
+def test_document_order():
+    log = CallLog(slow={"textDocument/formatting"})
+
+    async def run():
+        server = create_server(log, workers=2)
+        await server.exec_request(Request(1, "textDocument/formatting", PARAMS))
+        await server.exec_request(Request(2, "textDocument/hover", PARAMS))
+        await wait_requests(server)
+        return server.transport.written
+
+    responses = asyncio.run(run())
+    assert sorted(response.id for response in responses) == [1, 2]
+    # request wait previous exclusive request on the same document
+    assert log.items == [
+        ("start", "textDocument/formatting"),
+        ("end", "textDocument/formatting"),
+        ("start", "textDocument/hover"),
+        ("end", "textDocument/hover"),
+    ]
+
+
+def test_request_canceled():
+    started = threading.Event()
+
+    def handle(method, params):
+        started.set()
+        token = get_token()
+        while True:
+            token.check()
+            time.sleep(0.01)
+
+    async def run():
+        server = create_server(handle)
+        await server.exec_request(Request(1, "textDocument/hover", PARAMS))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        await server.exec_notification(Notification("$/cancelRequest", {"id": 1}))
+        await wait_requests(server)
+        return server.transport.written
+
+    (response,) = asyncio.run(run())
+    assert response.error["code"] == errors.RequestCancelled.code
+
+
+def test_idle_after_requests():
+    log = CallLog(slow={"textDocument/hover"})
+    open_params = {"textDocument": {"uri": URI, "version": 1, "text": ""}}
+
+    async def run():
+        server = create_server(log)
+        await server.exec_request(Request(1, "textDocument/hover", PARAMS))
+        await server.exec_notification(
+            Notification("textDocument/didOpen", open_params)
+        )
+        await wait_requests(server)
+        await asyncio.wait(list(server.idle_tasks.values()))
+
+    asyncio.run(run())
+    # internal request started after client request done
+    assert log.items.index(("start", WARM_UP_DOCUMENT)) > log.items.index(
+        ("end", "textDocument/hover")
+    )
+
+
+def test_request_stats():
+    async def run():
+        server = create_server()
+        await server.exec_request(Request(1, "textDocument/hover", PARAMS))
+        await server.exec_request(Request(2, REQUEST_STATS, None))
+        return list(server.transport.written)
+
+    # request tasks not started yet, stats answered at once
+    (response,) = asyncio.run(run())
+    assert response.id == 2
+    assert response.result["received"] == 1
+    assert response.result["queue_depth"] == 1
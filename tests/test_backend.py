@@ -0,0 +1,115 @@
+"""process backend test"""
+
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from pyserver import errors
+from pyserver.backend import ProcessBackend
+from pyserver.cancellation import CancellationToken, get_token, use_token
+from pyserver.session import Session
+
+# configuration of worker process
+_configuration = None
+
+
+def get_document_names(session: Session, params: dict) -> list:
+    return sorted(path.name for path in session.working_documents)
+
+
+def configure(session: Session, params: dict) -> None:
+    global _configuration
+    _configuration = params["value"]
+
+
+def wait_canceled(session: Session, params: dict) -> str:
+    token = get_token()
+    while not token.is_expired():
+        token.check()
+        time.sleep(0.01)
+    return "expired"
+
+
+def set_configuration(value: int) -> None:
+    global _configuration
+    _configuration = value
+
+
+def check_configuration(session: Session, params: dict) -> None:
+    if _configuration != params["value"]:
+        raise errors.InvalidParams(f"configuration {_configuration!r}")
+
+
+@pytest.fixture(scope="module")
+def backend():
+    backend = ProcessBackend(2)
+    yield backend
+    backend.shutdown()
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = Session()
+    session.root_path = tmp_path
+    for name in ("a.py", "b.py"):
+        session.add_document(tmp_path / name, "python", 1, "")
+    return session
+
+
+def document_params(session: Session, name: str) -> dict:
+    return {"textDocument": {"uri": (session.root_path / name).as_uri()}}
+
+
+def test_target_document(backend, session):
+    handle = backend.wrap(__name__, "get_document_names")
+    assert handle(session, document_params(session, "b.py")) == ["b.py"]
+
+
+def test_open_documents(backend, session):
+    handle = backend.wrap(__name__, "get_document_names", open_documents=True)
+    assert handle(session, document_params(session, "a.py")) == ["a.py", "b.py"]
+
+
+def test_handler_error(backend, session):
+    check = backend.wrap(__name__, "check_configuration")
+    with pytest.raises(errors.InvalidParams):
+        check(session, {"value": "unknown"})
+
+
+def test_deadline_in_worker(backend, session):
+    wait = backend.wrap(__name__, "wait_canceled")
+    with use_token(CancellationToken(0.2)):
+        assert wait(session, {}) == "expired"
+
+
+def test_request_canceled(backend, session):
+    wait = backend.wrap(__name__, "wait_canceled")
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel).start()
+    with use_token(token), pytest.raises(errors.RequestCancelled):
+        wait(session, {})
+
+    # canceled handler stopped, every worker run next request
+    handle = backend.wrap(__name__, "get_document_names", broadcast=True)
+    assert handle(session, document_params(session, "a.py")) == ["a.py"]
+
+
+def test_broadcast_notification(backend, session):
+    notify = backend.wrap(__name__, "configure", broadcast=True, notification=True)
+    check = backend.wrap(__name__, "check_configuration", broadcast=True)
+
+    # every worker handle the notification before later request
+    for value in range(3):
+        assert notify(session, {"value": value}) is None
+        check(session, {"value": value})
+
+
+def test_worker_configured(session):
+    backend = ProcessBackend(1, configure=partial(set_configuration, -1))
+    try:
+        check = backend.wrap(__name__, "check_configuration")
+        check(session, {"value": -1})
+    finally:
+        backend.shutdown()
@@ -0,0 +1,72 @@
+"""cache test"""
+
+from pyserver.cache import FileCache, LRUCache
+
+
+def test_lru_eviction():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    # recently used item kept
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_lru_cost_budget():
+    cache = LRUCache(10, max_cost=5, get_cost=len)
+    cache.put("a", "xx")
+    cache.put("b", "xx")
+    cache.put("a", "xxx")
+    assert cache.cost == 5
+
+    # least recently used items evicted until cost within budget
+    cache.put("c", "xxxx")
+    assert list(cache._items) == ["c"]
+    assert cache.cost == 4
+    cache.pop("c")
+    assert cache.cost == 0
+
+
+def test_lru_setdefault_and_stats():
+    cache = LRUCache(10)
+    assert cache.setdefault("a", lambda: 1) == 1
+    assert cache.setdefault("a", lambda: 2) == 1
+    cache.remove_if(lambda key: key == "a")
+    assert cache.get("a") is None
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_file_cache(tmp_path):
+    cache = FileCache(tmp_path, "1")
+    assert cache.load("module", 10) is None
+
+    cache.save("module", 10, {"name": ["a", "b"]})
+    assert cache.load("module", 10) == {"name": ["a", "b"]}
+    assert cache.load("other", 10) is None
+    # stored value invalid if validator or cache version changed
+    assert cache.load("module", 11) is None
+    assert FileCache(tmp_path, "2").load("module", 10) is None
+
+
+def test_file_cache_shared(tmp_path):
+    FileCache(tmp_path, "1").save("module", 10, [1])
+    # value replaced by other process
+    FileCache(tmp_path, "1").save("module", 11, [2])
+    assert FileCache(tmp_path, "1").load("module", 11) == [2]
+    assert [p.suffix for p in tmp_path.iterdir()] == [".json"]
+
+
+def test_file_cache_corrupted(tmp_path):
+    cache = FileCache(tmp_path, "1")
+    cache.save("module", 10, [1])
+    for path in tmp_path.iterdir():
+        path.write_text("{")
+
+    assert cache.load("module", 10) is None
+    cache.save("module", 10, [2])
+    assert cache.load("module", 10) == [2]
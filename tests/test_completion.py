@@ -0,0 +1,189 @@
+"""completion test"""
+
+import pytest
+
+from pyserver.cache import FileCache
+from pyserver.features.completion import (
+    CompletionItem,
+    CompletionProvider,
+    CompletionResult,
+    LibraryItemStore,
+    configure,
+    textdocument_completion,
+)
+from pyserver.session import Session
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = Session()
+    session.root_path = tmp_path
+    return session
+
+
+def complete(session: Session, text: str, line: int, character: int) -> dict:
+    file_path = session.root_path / "module.py"
+    session.add_document(file_path, "python", 1, text)
+    params = {
+        "textDocument": {"uri": file_path.as_uri()},
+        "position": {"line": line, "character": character},
+    }
+    return textdocument_completion(session, params)
+
+
+def get_item(result: dict, label: str) -> dict:
+    return next(item for item in result["items"] if item["label"] == label)
+
+
+def create_result(text: str, names: list, is_complete: bool = True):
+    """result at end of one line text, identifier typed at line start"""
+
+    items = [CompletionItem(name, "", "", "statement") for name in names]
+    text_range = {
+        "start": {"line": 0, "character": 0},
+        "end": {"line": 0, "character": len(text)},
+    }
+    length = len(text)
+    return CompletionResult(
+        items, text_range, False, False, is_complete, text, length, 0, text, 0, length
+    )
+
+
+def test_insert_brackets(session):
+    text = "def foo_empty() -> int:\n    pass\ndef foo_args(a):\n    pass\nfoo_"
+    result = complete(session, text, 4, 4)
+
+    # signature of function without parameters known before resolved
+    empty = get_item(result, "foo_empty")
+    assert empty["textEdit"]["newText"] == "foo_empty()"
+    assert empty["detail"] == "foo_empty() -> int"
+    args = get_item(result, "foo_args")
+    assert args["textEdit"]["newText"] == "foo_args(${1})"
+    assert "detail" not in args
+
+
+def test_refine_typed():
+    result = create_result("fo", ["foo", "foo_bar", "f_o_o_b", "bar"])
+    refined = result.refine("foob", 4, 0, "foob", "utf-16")
+
+    assert [item.text for item in refined.items] == ["foo_bar", "f_o_o_b"]
+    assert refined.prefix == "foob"
+    assert refined.text_edit_range["end"] == {"line": 0, "character": 4}
+    # refined again from refined result
+    refined = refined.refine("fooba", 5, 0, "fooba", "utf-16")
+    assert [item.text for item in refined.items] == ["foo_bar"]
+
+
+def test_refine_rejected():
+    result = create_result("fo", ["foo"])
+    # deleted, typed elsewhere or not identifier
+    assert not result.refine("f", 1, 0, "f", "utf-16")
+    assert not result.refine("xfo", 3, 0, "xfo", "utf-16")
+    assert not result.refine("fo(", 3, 0, "fo(", "utf-16")
+    assert not result.refine("fo\no", 4, 1, "o", "utf-16")
+    # candidates not complete, computed again
+    result = create_result("fo", ["foo"], is_complete=False)
+    assert not result.refine("foo", 3, 0, "foo", "utf-16")
+
+
+def test_rank():
+    names = ["_foo", "xfoo", "Foo", "__foo__", "foo_bar", "foo", "f_o_o"]
+    result = create_result("foo", names)
+    items, is_truncated = result.get_best_items(10)
+
+    # prefix match, case insensitive, fewest skipped characters,
+    # private names last if matched alike
+    assert [item.text for item in items] == [
+        "foo",
+        "foo_bar",
+        "Foo",
+        "xfoo",
+        "_foo",
+        "f_o_o",
+        "__foo__",
+    ]
+    assert not is_truncated
+
+
+def test_truncated(monkeypatch):
+    monkeypatch.setattr(CompletionResult, "limit", 2)
+    result = create_result("fo", ["fo_c", "fo_b", "fo_a"])
+
+    completion_list = result.to_completion_list(None)
+    # best items kept in ranked order, client request again while typing
+    assert [item["label"] for item in completion_list["items"]] == ["fo_a", "fo_b"]
+    assert [item["sortText"] for item in completion_list["items"]] == ["0", "1"]
+    assert completion_list["isIncomplete"]
+
+
+def test_configure(monkeypatch):
+    cached_items = CompletionProvider.cached_items
+    monkeypatch.setattr(CompletionResult, "limit", CompletionResult.limit)
+    monkeypatch.setattr(cached_items, "max_cost", cached_items.max_cost)
+
+    configure(1024, 0)
+    assert cached_items.max_cost == 1024
+    # at least one item sent
+    assert CompletionResult.limit == 1
+
+
+def test_item_defaults():
+    result = create_result("fo", ["foo", "foo_bar"])
+    data = {"uri": "file:///a.py", "line": 0, "character": 2}
+
+    # shared fields sent once if supported by client
+    completion_list = result.to_completion_list(
+        data, ["editRange", "insertTextFormat", "data"]
+    )
+    assert completion_list["itemDefaults"] == {
+        "editRange": result.text_edit_range,
+        "insertTextFormat": 2,
+        "data": data,
+    }
+    assert completion_list["items"][0] == {"label": "foo", "kind": 6, "sortText": "0"}
+
+    # every field sent with each item otherwise
+    completion_list = result.to_completion_list(data, ["data"])
+    assert completion_list["itemDefaults"] == {"data": data}
+    item = completion_list["items"][0]
+    assert item["textEdit"] == {"range": result.text_edit_range, "newText": "foo"}
+    assert item["insertTextFormat"] == 2
+    assert "data" not in item
+    assert "itemDefaults" not in result.to_completion_list(data)
+
+
+def test_item_defaults_edit_text():
+    result = create_result("fo", ["foo"])
+    result.items = [CompletionItem("foo", "", "", "function")]
+    result.is_append_bracket = True
+
+    # inserted text differ from label
+    (item,) = result.to_completion_list(None, ["editRange"])["items"]
+    assert item["textEditText"] == "foo()"
+    assert "textEdit" not in item
+
+
+def test_item_defaults_capability(session):
+    session.client_capabilities = {
+        "textDocument": {
+            "completion": {"completionList": {"itemDefaults": ["insertTextFormat"]}}
+        }
+    }
+    result = complete(session, "foo_bar = 1\nfoo_", 1, 4)
+    assert result["itemDefaults"] == {"insertTextFormat": 2}
+    assert "insertTextFormat" not in get_item(result, "foo_bar")
+
+
+def test_library_items_stored(tmp_path):
+    store = LibraryItemStore(FileCache(tmp_path, "1"))
+    store.add("/lib/os.py", 10, CompletionItem("getcwd", "", "str", "function"))
+    store.save()
+
+    # items persisted for next session
+    other = LibraryItemStore(FileCache(tmp_path, "1"))
+    item = other.load("/lib/os.py", 10)["getcwd"]
+    assert item.signature() == "getcwd() -> str"
+    assert item.documentation is None
+    # loaded once, items of modified module invalid
+    assert other.load("/lib/os.py", 10) == {}
+    assert other.load("/lib/os.py", 11) == {}
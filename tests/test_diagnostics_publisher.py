@@ -0,0 +1,75 @@
+"""diagnostics publisher test"""
+
+import queue
+import threading
+import time
+
+from pyserver.cancellation import get_token
+from pyserver.server import DiagnosticsPublisher
+
+
+def document_params(uri: str, version: int) -> dict:
+    return {"textDocument": {"uri": uri, "version": version}}
+
+
+def get_diagnostics(method, params):
+    return params["textDocument"]
+
+
+def create_publisher(handle_function=get_diagnostics, **kwargs):
+    notifications = queue.Queue()
+    publisher = DiagnosticsPublisher(
+        handle_function, lambda method, params: notifications.put(params), **kwargs
+    )
+    publisher.run()
+    return publisher, notifications
+
+
+def test_debounce():
+    publisher, notifications = create_publisher(delay=0.1)
+    for version in range(1, 4):
+        publisher.publish(document_params("file:///a.py", version))
+
+    # only document unchanged for delay checked
+    assert notifications.get(timeout=5)["version"] == 3
+    time.sleep(0.2)
+    assert notifications.empty()
+
+
+def test_documents_parallel():
+    # each check wait the other, pass only if checked in parallel
+    barrier = threading.Barrier(2, timeout=5)
+
+    def handle(method, params):
+        barrier.wait()
+        return params["textDocument"]
+
+    publisher, notifications = create_publisher(handle, workers=2, delay=0)
+    publisher.publish(document_params("file:///a.py", 1))
+    publisher.publish(document_params("file:///b.py", 1))
+
+    uris = {notifications.get(timeout=5)["uri"] for _ in range(2)}
+    assert uris == {"file:///a.py", "file:///b.py"}
+
+
+def test_running_check_canceled():
+    started = threading.Event()
+
+    def handle(method, params):
+        if params["textDocument"]["version"] == 1:
+            started.set()
+            token = get_token()
+            while True:
+                token.check()
+                time.sleep(0.01)
+        return params["textDocument"]
+
+    publisher, notifications = create_publisher(handle, delay=0)
+    publisher.publish(document_params("file:///a.py", 1))
+    assert started.wait(5)
+    publisher.publish(document_params("file:///a.py", 2))
+
+    # check of previous version canceled without notification
+    assert notifications.get(timeout=5)["version"] == 2
+    time.sleep(0.1)
+    assert notifications.empty()
@@ -0,0 +1,94 @@
+"""lsp server test"""
+
+import pytest
+
+from pyserver.message import Notification, Request, loads
+from pyserver.server import REQUEST_STATS, LSPServer, merge_document_changes
+from pyserver.transport import Transport
+
+
+class MemoryTransport(Transport):
+    """collect messages written by server"""
+
+    def __init__(self):
+        self.written = []
+
+    def listen_connection(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def write(self, data: bytes):
+        self.written.append(loads(data))
+
+    def read(self) -> bytes:
+        raise EOFError("no message")
+
+
+def create_server(handle_func=lambda method, params: None, **kwargs) -> LSPServer:
+    return LSPServer(MemoryTransport(), handle_func, **kwargs)
+
+
+def did_change(uri: str, version: int, *texts: str) -> Notification:
+    return Notification(
+        "textDocument/didChange",
+        {
+            "textDocument": {"uri": uri, "version": version},
+            "contentChanges": [{"text": text} for text in texts],
+        },
+    )
+
+
+def test_merge_document_changes():
+    merged = merge_document_changes(
+        did_change("file:///a.py", 1, "a"), did_change("file:///a.py", 2, "b", "c")
+    )
+    # changes applied in order, latest version kept
+    assert merged.params["textDocument"]["version"] == 2
+    assert merged.params["contentChanges"] == [
+        {"text": "a"},
+        {"text": "b"},
+        {"text": "c"},
+    ]
+
+    first = did_change("file:///a.py", 1, "a")
+    assert not merge_document_changes(first, did_change("file:///b.py", 2, "b"))
+    assert not merge_document_changes(first, Request(1, "textDocument/hover", {}))
+
+
+def test_coalesce_changes():
+    server = create_server()
+    for message in (
+        did_change("file:///a.py", 2, "b"),
+        did_change("file:///a.py", 3, "c"),
+        did_change("file:///b.py", 1, "d"),
+    ):
+        server.received_messages.put(message)
+    server.received_messages.put(EOFError("no message"))
+
+    message = server._coalesce_changes(did_change("file:///a.py", 1, "a"))
+    assert message.params["textDocument"]["version"] == 3
+    assert [c["text"] for c in message.params["contentChanges"]] == ["a", "b", "c"]
+
+    # change of other document and reader error kept in order
+    assert server._get_message().params["textDocument"]["uri"] == "file:///b.py"
+    message = server._coalesce_changes(did_change("file:///b.py", 2, "e"))
+    assert message.params["textDocument"]["version"] == 2
+    with pytest.raises(EOFError):
+        server._get_message()
+
+
+def test_request_stats():
+    server = create_server(queue_size=1)
+    params = {"textDocument": {"uri": "file:///a.py"}}
+    server.exec_request(Request(1, "textDocument/hover", params))
+    server.exec_request(Request(2, "textDocument/definition", params))
+    server.exec_request(Request(3, REQUEST_STATS, None))
+
+    # workers not started, stats answered at once
+    response = server.transport.written[-1]
+    assert response.id == 3
+    assert response.result["received"] == 2
+    assert response.result["shed"] == 1
+    assert response.result["queue_depth"] == 1
@@ -0,0 +1,72 @@
+"""position encoding test"""
+
+import pytest
+
+from pyserver.position import (
+    DEFAULT_ENCODING,
+    UTF8,
+    UTF16,
+    UTF32,
+    from_client_character,
+    negotiate_encoding,
+    to_client_character,
+)
+
+LINES = [
+    "",
+    "ascii only",
+    "café = '€'",
+    "\U0001f600\U0001f600 x",
+    "aé€\U0001f600b",
+]
+
+
+def count_units(text: str, encoding: str) -> int:
+    if encoding == UTF8:
+        return len(text.encode("utf-8"))
+    if encoding == UTF16:
+        return len(text.encode("utf-16-le")) // 2
+    return len(text)
+
+
+def naive_from_client(line: str, unit: int, encoding: str) -> int:
+    """index of character which contain code unit"""
+
+    for index in range(len(line)):
+        if count_units(line[: index + 1], encoding) > unit:
+            return index
+    return len(line) + unit - count_units(line, encoding)
+
+
+@pytest.mark.parametrize("encoding", [UTF8, UTF16, UTF32])
+@pytest.mark.parametrize("line", LINES)
+def test_to_client_character(line, encoding):
+    for character in range(len(line) + 3):
+        expected = count_units(line, encoding) + max(character - len(line), 0)
+        if character <= len(line):
+            expected = count_units(line[:character], encoding)
+        assert to_client_character(line, character, encoding) == expected
+
+
+@pytest.mark.parametrize("encoding", [UTF8, UTF16, UTF32])
+@pytest.mark.parametrize("line", LINES)
+def test_from_client_character(line, encoding):
+    for unit in range(count_units(line, encoding) + 3):
+        expected = naive_from_client(line, unit, encoding)
+        assert from_client_character(line, unit, encoding) == expected
+
+
+@pytest.mark.parametrize("encoding", [UTF8, UTF16, UTF32])
+@pytest.mark.parametrize("line", LINES)
+def test_round_trip(line, encoding):
+    for character in range(len(line) + 1):
+        unit = to_client_character(line, character, encoding)
+        assert from_client_character(line, unit, encoding) == character
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None) == DEFAULT_ENCODING
+    assert negotiate_encoding(["utf-7"]) == DEFAULT_ENCODING
+    assert negotiate_encoding([UTF8, UTF16]) == UTF16
+    assert negotiate_encoding([UTF8, UTF32]) == UTF32
+    assert negotiate_encoding([UTF8]) == UTF8
@@ -0,0 +1,225 @@
+"""request manager scheduling test"""
+
+import threading
+import time
+
+import pytest
+
+from pyserver import errors
+from pyserver.cancellation import get_token
+from pyserver.message import Request
+from pyserver.server import Priority, QueuedRequest, RequestManager
+
+COMPLETION = "textDocument/completion"
+HOVER = "textDocument/hover"
+FORMATTING = "textDocument/formatting"
+SYMBOL = "textDocument/documentSymbol"
+PREPARE_RENAME = "textDocument/prepareRename"
+IDLE = "pyserver/warmUpDocument"
+
+
+def document_params(uri: str = "file:///a.py", line: int = 0) -> dict:
+    return {
+        "textDocument": {"uri": uri},
+        "position": {"line": line, "character": 0},
+    }
+
+
+class Responses:
+    """collect sent responses"""
+
+    def __init__(self):
+        self.items = []
+        self.received = threading.Event()
+
+    def __call__(self, request_id, result, error):
+        self.items.append((request_id, result, error))
+        self.received.set()
+
+    def error_codes(self) -> dict:
+        return {id_: error["code"] for id_, _, error in self.items if error}
+
+
+def create_manager(**kwargs) -> RequestManager:
+    kwargs.setdefault("response_callback", Responses())
+    return RequestManager(lambda method, params: None, **kwargs)
+
+
+def pop_ids(manager: RequestManager) -> list:
+    """pop every ready request, none of them finished"""
+
+    ids = []
+    while item := manager._pop_ready_request():
+        manager.running_requests[item.request.id] = item
+        ids.append(item.request.id)
+    return ids
+
+
+def test_ready_by_priority():
+    manager = create_manager(
+        priorities={COMPLETION: Priority.Interactive, SYMBOL: Priority.Background},
+        workers=4,
+    )
+    manager.add(Request(1, SYMBOL, document_params("file:///a.py")))
+    manager.add(Request(2, HOVER, document_params("file:///b.py")))
+    manager.add(Request(3, COMPLETION, document_params("file:///c.py")))
+
+    assert pop_ids(manager) == [3, 2, 1]
+
+
+def test_equal_priority_in_order():
+    manager = create_manager()
+    for request_id in range(3):
+        uri = f"file:///{request_id}.py"
+        manager.add(Request(request_id, HOVER, document_params(uri)))
+
+    assert pop_ids(manager) == [0, 1, 2]
+
+
+def test_parallel_requests():
+    manager = create_manager()
+    manager.add(Request(1, HOVER, document_params()))
+    manager.add(Request(2, COMPLETION, document_params()))
+    manager.add(Request(3, FORMATTING, document_params("file:///b.py")))
+
+    # readonly requests of a document and requests of other documents
+    assert pop_ids(manager) == [1, 2, 3]
+
+
+def test_exclusive_request_wait_previous():
+    manager = create_manager(priorities={COMPLETION: Priority.Interactive})
+    manager.add(Request(1, HOVER, document_params()))
+    manager.add(Request(2, FORMATTING, document_params()))
+    manager.add(Request(3, COMPLETION, document_params()))
+
+    # formatting change the document, wait for hover to finish;
+    # completion wait for formatting
+    assert pop_ids(manager) == [1]
+
+    del manager.running_requests[1]
+    assert pop_ids(manager) == [2]
+
+    del manager.running_requests[2]
+    assert pop_ids(manager) == [3]
+
+
+def test_aged_background_request():
+    manager = create_manager(
+        priorities={SYMBOL: Priority.Background, HOVER: Priority.Interactive}
+    )
+    manager.add(Request(1, SYMBOL, document_params("file:///a.py")))
+    manager.request_queue[0].queued_time -= 3 * manager.aging_interval
+    manager.add(Request(2, HOVER, document_params("file:///b.py")))
+
+    assert pop_ids(manager) == [1, 2]
+
+
+def test_superseded():
+    responses = Responses()
+    manager = create_manager(response_callback=responses)
+    manager.add(Request(1, COMPLETION, document_params(line=1)))
+    manager.add(Request(2, HOVER, document_params(line=1)))
+    manager.add(Request(3, COMPLETION, document_params(line=2)))
+
+    assert [q.request.id for q in manager.request_queue] == [2, 3]
+    assert responses.error_codes() == {1: errors.ServerCancelled.code}
+    assert manager.get_stats()["superseded"] == 1
+
+
+def test_shed_lowest_priority():
+    responses = Responses()
+    manager = create_manager(
+        response_callback=responses,
+        priorities={SYMBOL: Priority.Background},
+        queue_size=2,
+    )
+    manager.add(Request(1, SYMBOL, document_params("file:///a.py")))
+    manager.add(Request(2, HOVER, document_params("file:///b.py")))
+    manager.add(Request(3, HOVER, document_params("file:///c.py")))
+    manager.add(Request(4, HOVER, document_params("file:///d.py")))
+
+    # background request shed first, then the newest of equal priority
+    assert [q.request.id for q in manager.request_queue] == [2, 3]
+    assert responses.error_codes() == {
+        1: errors.ServerCancelled.code,
+        4: errors.ServerCancelled.code,
+    }
+
+    stats = manager.get_stats()
+    assert stats["shed"] == 2
+    assert stats["max_queue_depth"] == 2
+
+
+def test_cancel_outdated():
+    responses = Responses()
+    manager = create_manager(response_callback=responses)
+    manager.add(Request(1, PREPARE_RENAME, document_params(line=1)), version=1)
+    manager.add(Request(2, HOVER, document_params("file:///b.py", 9)), version=1)
+    manager.add(Request(3, HOVER, document_params(line=1)), version=1)
+    manager.add(Request(4, SYMBOL, document_params()), version=1)
+
+    manager.cancel_outdated("file:///a.py", 2, changed_line=3)
+
+    # prepareRename before changed line still valid, hover may show a
+    # definition after the changed line
+    assert [q.request.id for q in manager.request_queue] == [1, 2]
+    assert responses.error_codes() == {
+        3: errors.ContentModified.code,
+        4: errors.ContentModified.code,
+    }
+
+
+def test_outdated_position():
+    request = Request(1, PREPARE_RENAME, document_params(line=5))
+    item = QueuedRequest(request, Priority.Normal, version=1)
+
+    assert not item.is_outdated("file:///a.py", 1, changed_line=0)
+    assert not item.is_outdated("file:///a.py", 2, changed_line=6)
+    assert item.is_outdated("file:///a.py", 2, changed_line=5)
+    assert item.is_outdated("file:///a.py", 2, changed_line=0)
+
+
+def test_idle_wait_client_request():
+    manager = create_manager()
+    manager.add_idle(IDLE, document_params())
+    manager.add(Request(1, HOVER, document_params("file:///b.py")))
+
+    # idle request added first but not ready while client request waiting
+    # or running
+    assert pop_ids(manager) == [1]
+
+    del manager.running_requests[1]
+    assert pop_ids(manager) == [("idle", 1)]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_idle_preempted(workers):
+    calls = []
+    idle_started = threading.Event()
+
+    def handle(method, params):
+        calls.append(method)
+        if method == IDLE and calls.count(IDLE) == 1:
+            idle_started.set()
+            token = get_token()
+            while not token.is_canceled():
+                time.sleep(0.01)
+            token.check()
+
+    responses = Responses()
+    manager = RequestManager(handle, responses, workers=workers)
+    manager.run()
+
+    manager.add_idle(IDLE, document_params())
+    assert idle_started.wait(5)
+
+    # idle request canceled even if a worker is available
+    manager.add(Request(1, HOVER, document_params("file:///b.py")))
+    assert responses.received.wait(5)
+    assert responses.items == [(1, None, None)]
+
+    # canceled idle request queued again after the client request
+    deadline = time.monotonic() + 5
+    while calls.count(IDLE) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls == [IDLE, HOVER, IDLE]
@@ -0,0 +1,67 @@
+"""shared jedi script test"""
+
+import pytest
+
+from pyserver.document import Document
+from pyserver.features.script import use_script, workspace_didchangeconfiguration
+from pyserver.session import Session
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = Session()
+    session.root_path = tmp_path
+    return session
+
+
+def create_document(session: Session, version: int, text: str) -> Document:
+    file_path = session.root_path / "module.py"
+    return Document.from_text(session.root_path, file_path, "python", version, text)
+
+
+def get_names(session: Session, document: Document) -> list:
+    with use_script(session, document) as script:
+        return [name.name for name in script.get_names()]
+
+
+def test_script_reused(session):
+    document = create_document(session, 1, "def foo():\n    pass\n")
+    with use_script(session, document) as script:
+        pass
+    with use_script(session, document) as other:
+        assert other is script
+
+
+def test_versions_alternated(session):
+    first = create_document(session, 1, "def foo():\n    pass\n")
+    second = create_document(session, 2, "def bar():\n    pass\n")
+
+    # script of each version match its own code
+    assert get_names(session, first) == ["foo"]
+    assert get_names(session, second) == ["bar"]
+    assert get_names(session, first) == ["foo"]
+    assert get_names(session, second) == ["bar"]
+    assert len(session.script_cache) == 1
+
+
+def test_document_updated(session):
+    first = create_document(session, 1, "foo = 1\n")
+    session.working_documents[first.file_path] = first
+    get_names(session, first)
+
+    second = create_document(session, 2, "bar = 1\n")
+    session.update_document(second)
+    assert (first.file_path, 1) not in session.script_cache
+
+    get_names(session, second)
+    session.remove_document(second.file_path)
+    assert len(session.script_cache) == 0
+
+
+def test_configuration_changed(session):
+    document = create_document(session, 1, "foo = 1\n")
+    get_names(session, document)
+
+    workspace_didchangeconfiguration(session, {})
+    assert session.project is None
+    assert len(session.script_cache) == 0
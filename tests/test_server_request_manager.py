@@ -0,0 +1,64 @@
+"""server request manager test"""
+
+import pytest
+
+from pyserver.message import Response
+from pyserver.server import ResponseError, ServerRequestManager
+
+
+def test_request_resolved():
+    manager = ServerRequestManager()
+    first_id, first = manager.add("workspace/configuration")
+    second_id, second = manager.add("window/showMessageRequest")
+    assert first_id != second_id
+
+    # responses may be received in any order
+    manager.resolve(Response(second_id, {"title": "ok"}))
+    manager.resolve(Response(first_id, [{}]))
+
+    assert first.result(0) == [{}]
+    assert second.result(0) == {"title": "ok"}
+
+
+def test_request_failed():
+    manager = ServerRequestManager()
+    request_id, future = manager.add("workspace/configuration")
+
+    error = {"code": -32601, "message": "method not found"}
+    manager.resolve(Response(request_id, error=error))
+
+    with pytest.raises(ResponseError) as exc_info:
+        future.result(0)
+    assert exc_info.value.error == error
+
+
+def test_unknown_response_ignored():
+    manager = ServerRequestManager()
+    request_id, future = manager.add("workspace/configuration")
+
+    manager.resolve(Response(request_id + 1, {}))
+    assert not future.done()
+
+    manager.resolve(Response(request_id, {}))
+    # response of a resolved request ignored
+    manager.resolve(Response(request_id, None))
+    assert future.result(0) == {}
+
+
+def test_request_timeout():
+    manager = ServerRequestManager(timeout=0.05)
+    _, future = manager.add("workspace/configuration")
+
+    with pytest.raises(TimeoutError):
+        future.result(5)
+
+
+def test_canceled_request_expired():
+    manager = ServerRequestManager()
+    request_id, future = manager.add("workspace/configuration")
+
+    assert future.cancel()
+    # timer of a canceled request does not fail
+    manager._expire(request_id)
+    manager.resolve(Response(request_id, {}))
+    assert future.cancelled()
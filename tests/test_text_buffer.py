@@ -0,0 +1,130 @@
+"""text buffer test"""
+
+import random
+import re
+
+import pytest
+
+from pyserver import text_buffer
+from pyserver.position import UTF8, UTF16, UTF32
+from pyserver.position import from_client_character, to_client_character
+from pyserver.text_buffer import TextBuffer
+
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+@pytest.fixture(autouse=True)
+def small_leaf(monkeypatch):
+    """split text to many leaves, line breaks cross leaf boundaries"""
+    monkeypatch.setattr(text_buffer, "LEAF_SIZE", 4)
+
+
+def get_line_starts(text: str):
+    return [0] + [match.end() for match in LINE_BREAK.finditer(text)]
+
+
+def check_lines(buffer: TextBuffer, text: str):
+    """compare buffer with lines split by regular expression"""
+
+    assert str(buffer) == text
+    assert len(buffer) == len(text)
+
+    starts = get_line_starts(text)
+    lines = LINE_BREAK.split(text)
+    assert buffer.line_count == len(starts)
+
+    for line, (start, line_text) in enumerate(zip(starts, lines)):
+        assert buffer.get_line_offset(line) == start
+        assert buffer.get_line(line) == line_text
+        for character in range(-1, len(line_text) + 2):
+            expected = start + min(max(character, 0), len(line_text))
+            assert buffer.get_offset(line, character) == expected
+
+    for offset in range(len(text) + 1):
+        line = max(i for i, start in enumerate(starts) if start <= offset)
+        assert buffer.get_position(offset) == (line, offset - starts[line])
+
+
+def check_characters(buffer: TextBuffer, text: str):
+    """compare buffer conversion with line conversion"""
+
+    for encoding in (UTF8, UTF16, UTF32):
+        for line, line_text in enumerate(LINE_BREAK.split(text)):
+            for character in range(len(line_text) + 1):
+                assert buffer.to_client_character(
+                    line, character, encoding
+                ) == to_client_character(line_text, character, encoding)
+
+            units = to_client_character(line_text, len(line_text), encoding)
+            for unit in range(units + 1):
+                assert buffer.from_client_character(
+                    line, unit, encoding
+                ) == from_client_character(line_text, unit, encoding)
+
+
+def random_edits(alphabet: str, seed: int, count: int):
+    """yield text and buffer after each random edit"""
+
+    rnd = random.Random(seed)
+
+    def random_text(size: int):
+        return "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, size)))
+
+    for _ in range(count):
+        text = random_text(30)
+        buffer = TextBuffer(text)
+        yield buffer, text
+
+        for _ in range(5):
+            start = rnd.randint(0, len(text))
+            end = rnd.randint(start, len(text))
+            new_text = random_text(8)
+            buffer = buffer.replace(start, end, new_text)
+            text = text[:start] + new_text + text[end:]
+            yield buffer, text
+
+
+def test_empty():
+    buffer = TextBuffer()
+    assert str(buffer) == ""
+    assert buffer.line_count == 1
+    assert buffer.get_line(0) == ""
+    assert buffer.get_offset(3, 3) == 0
+    assert buffer.get_position(5) == (0, 0)
+
+
+@pytest.mark.parametrize("line_break", ["\n", "\r\n", "\r"])
+def test_line_break(line_break):
+    text = line_break.join(["first", "", "third line", ""])
+    check_lines(TextBuffer(text), text)
+
+
+def test_crlf_split_by_edit():
+    buffer = TextBuffer("a\r\nb")
+    assert buffer.line_count == 2
+
+    # insert between '\r' and '\n', now two line breaks
+    buffer = buffer.replace(2, 2, "x")
+    assert str(buffer) == "a\rx\nb"
+    check_lines(buffer, "a\rx\nb")
+
+    # join '\r' and '\n' again
+    buffer = buffer.replace(2, 3, "")
+    check_lines(buffer, "a\r\nb")
+
+
+def test_line_exceed_text():
+    buffer = TextBuffer("a\nbc")
+    assert buffer.get_line_offset(5) == 4
+    assert buffer.get_line(5) == ""
+    assert buffer.get_offset(5, 1) == 4
+
+
+def test_random_edits():
+    for buffer, text in random_edits("ab\r\n", seed=0, count=300):
+        check_lines(buffer, text)
+
+
+def test_random_edits_characters():
+    for buffer, text in random_edits("ab\n\ré€\U0001f600", seed=1, count=200):
+        check_characters(buffer, text)